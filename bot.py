@@ -11,18 +11,29 @@ from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
+# uvloop is a faster drop-in event loop (not available on Windows)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Import config (to load BOT_TOKEN from .env)
 from utils.config import settings
 
 # Import handlers
 from handlers import user_handlers, admin_handlers
 
+# Shared Marzban HTTP session and token cache
+from marzban._http import close_session
+from marzban.get_token import get_token, cancel_refresh_tasks
+
 
 async def main():
     """
     Main function to start the Telegram bot.
     - Initializes the bot with the token
     - Registers handlers
+    - Preloads Marzban tokens
     - Starts polling
     """
     # Configure logging
@@ -41,14 +52,28 @@ async def main():
     dp.include_router(user_handlers.router)
     dp.include_router(admin_handlers.router)
 
+    # Warm the Marzban token cache so the first user of each tier skips the auth hop
+    tiers = ("free", "test", "vip")
+    results = await asyncio.gather(*(get_token(t) for t in tiers), return_exceptions=True)
+    for tier, result in zip(tiers, results):
+        if isinstance(result, Exception):
+            logging.warning("⚠️ Could not preload Marzban token for '%s': %s", tier, result)
+
     logging.info("🤖 Bot is starting...")
 
-    # Start polling
-    await dp.start_polling(bot)
+    # Start polling (stop token refreshes and close the shared Marzban session on shutdown)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await cancel_refresh_tasks()
+        await close_session()
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if uvloop is not None:
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
         logging.info("❌ Bot stopped.")
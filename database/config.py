@@ -1,13 +1,13 @@
-from dotenv import load_dotenv
-import os
+# Database settings only (utils.config.DatabaseSettings): the bot secrets are not required here
+from utils.config import get_db_settings
 
-load_dotenv()
+_db = get_db_settings()
 
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_HOST = _db.DB_HOST
+DB_PORT = _db.DB_PORT
+DB_NAME = _db.DB_NAME
+DB_USER = _db.DB_USER
+DB_PASSWORD = _db.DB_PASSWORD
 
 # Async URL for PostgreSQL + SQLAlchemy
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
@@ -0,0 +1,101 @@
+"""
+_http.py
+--------
+Shared aiohttp session for all Marzban API helpers.
+
+Features:
+- Lazily creates one ClientSession for the bot's lifetime
+- Pooled TCPConnector with keep-alive (no TCP/TLS handshake per request),
+  sized for the expected number of concurrent Marzban calls
+- Rebuilds the session if it was closed
+- close_session() must be awaited on bot shutdown
+- BASE_URL: Marzban host, normalized and validated once at import
+- backoff(): one retry policy (full-jitter exponential, 30s budget) for every helper
+"""
+
+import asyncio
+import random
+import time
+from typing import Optional
+
+import aiohttp
+
+from utils.config import settings
+
+# Marzban base URL without trailing slash (host is fixed after config load)
+BASE_URL = settings.MARZBAN_HOST.rstrip("/")
+if not BASE_URL:
+    raise RuntimeError("MARZBAN_HOST not defined in .env")
+
+# Total retry budget per helper call (seconds); pass time.monotonic() + RETRY_BUDGET as the deadline
+RETRY_BUDGET = 30.0
+
+# Shared session (created on first use)
+_session: Optional[aiohttp.ClientSession] = None
+
+# Lock to prevent two coroutines from creating two sessions at once
+_session_lock = asyncio.Lock()
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """
+    Return the shared aiohttp session, creating it on first use.
+
+    Returns:
+        aiohttp.ClientSession: Session with a pooled keep-alive connector.
+    """
+    global _session
+    if _session is not None and not _session.closed:
+        return _session
+
+    async with _session_lock:
+        # Double-check inside lock
+        if _session is None or _session.closed:
+            # All traffic goes to one Marzban host, so limit_per_host caps how many
+            # API calls run in parallel; extra requests wait for a free connection.
+            connector = aiohttp.TCPConnector(
+                limit=50,
+                limit_per_host=50,
+                ttl_dns_cache=300,
+                keepalive_timeout=75.0,
+                enable_cleanup_closed=True,
+                force_close=False,
+            )
+            _session = aiohttp.ClientSession(
+                connector=connector,
+                # Per-socket limits only; overall deadlines are set per call with asyncio.timeout()
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=3, sock_read=5),
+            )
+        return _session
+
+
+async def close_session() -> None:
+    """
+    Close the shared aiohttp session (call once on bot shutdown).
+    """
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def backoff(attempt: int, max_retries: int, deadline: float) -> bool:
+    """
+    Sleep before the next retry using exponential backoff with full jitter.
+
+    Args:
+        attempt (int): The attempt that just failed (1-based).
+        max_retries (int): Total number of attempts allowed.
+        deadline (float): time.monotonic() value after which no retry may start.
+
+    Returns:
+        bool: False (without sleeping) when the caller should stop retrying.
+    """
+    if attempt >= max_retries:
+        return False
+    # Full jitter desynchronizes concurrent retries
+    delay = random.uniform(0, min(RETRY_BUDGET, 0.5 * (2 ** attempt)))
+    if time.monotonic() + delay > deadline:
+        return False
+    await asyncio.sleep(delay)
+    return True
@@ -4,29 +4,54 @@ create_user.py
 Async helper to create a new user on Marzban panel.
 
 Features:
-- Uses cached JWT tokens from marzban.get_token.get_token()
+- Uses cached auth headers from marzban.get_token.get_auth_headers()
 - Auto-assigns group_id based on tier (free/test/vip)
 - Calculates expiration date and data limit dynamically
-- Validates payload using Pydantic (v2+)
+- Builds the request body directly from bot-controlled values (no per-call validation)
 - Handles token refresh (401) and retry with backoff
-- Returns parsed MarzbanUserResponse (including data_limit_gb and subscription_url)
+- Always sends an Idempotency-Key (deterministic per user/plan/day by default)
+- Concurrent calls for the same username share one in-flight request
+- Returns MarzbanUserResponse decoded by msgspec (including data_limit_gb and subscription_url)
 """
 
 import asyncio
+import hashlib
 import logging
-from typing import Optional, Dict, Any, Literal
+import time
+from datetime import date
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Literal, Mapping, Tuple
 
 import aiohttp
-from pydantic import BaseModel, Field
+import msgspec
+import orjson
+from pydantic import BaseModel, ConfigDict, Field
 
-from marzban.get_token import get_token
-from utils.config import settings
+from marzban._http import BASE_URL, RETRY_BUDGET, backoff, get_session
+from marzban.get_token import get_auth_headers, invalidate
 from utils.time_utils import make_expire_date
 from utils.qrcode_utils import generate_qr_code
 from utils.byte_utils import gb_to_bytes
 
 logger = logging.getLogger(__name__)
 
+# User endpoint (precomputed once)
+_USER_URL = f"{BASE_URL}/api/user"
+
+
+# ---------- Constants ----------
+# Tier -> Marzban group mapping (read-only; tuples serialize as JSON arrays)
+_GROUP_MAP: Mapping[str, Tuple[int, ...]] = MappingProxyType({"vip": (4,), "test": (5,), "free": (6,)})
+
+# Proxy settings sent for every new user (bot-controlled, never mutated)
+_PROXY_SETTINGS: Dict[str, Dict[str, str]] = {
+    "vless": {"flow": "xtls-rprx-vision"},
+    "shadowsocks": {"method": "chacha20-ietf-poly1305"},
+}
+
+# In-flight create requests keyed by username (concurrent duplicates share one)
+_inflight: Dict[str, "asyncio.Task[MarzbanUserResponse]"] = {}
+
 
 # ---------- Models ----------
 class ProxySettings(BaseModel):
@@ -35,7 +60,9 @@ class ProxySettings(BaseModel):
 
 
 class CreateUserPayload(BaseModel):
-    """Validates Marzban /api/user request body."""
+    """Schema of the Marzban /api/user request body (reference; not validated per call)."""
+
+    model_config = ConfigDict(extra="allow")
 
     username: str = Field(..., min_length=3, max_length=32)
     status: Literal["active"] = "active"  # always active (bot-controlled)
@@ -45,19 +72,16 @@ class CreateUserPayload(BaseModel):
     group_ids: Optional[list[int]] = Field(default_factory=list)
     proxy_settings: Optional[ProxySettings] = None
 
-    class Config:
-        extra = "allow"
-
 
-class MarzbanUserResponse(BaseModel):
-    """Simplified Marzban API response model."""
+class MarzbanUserResponse(msgspec.Struct, kw_only=True):
+    """Simplified Marzban API response model (decoded straight from JSON bytes by msgspec)."""
 
-    id: Optional[int]
-    username: Optional[str]
-    status: Optional[str]
-    data_limit_gb: Optional[int]
-    expire: Optional[str]
-    subscription_url: Optional[str]
+    id: Optional[int] = None
+    username: Optional[str] = None
+    status: Optional[str] = None
+    data_limit_gb: Optional[int] = None
+    expire: Optional[str] = None
+    subscription_url: Optional[str] = None
 
     # ---------- Derived Field ----------
     @property
@@ -82,8 +106,80 @@ class MarzbanUserResponse(BaseModel):
         except OSError as e:
             logger.warning("⚠️ File or I/O error while generating QR for %s: %s", self.username, e)
 
-    class Config:
-        extra = "allow"
+
+# Reusable decoder: JSON bytes -> MarzbanUserResponse in one pass (unknown fields ignored)
+_response_decoder = msgspec.json.Decoder(MarzbanUserResponse)
+
+
+# ---------- Request ----------
+async def _post_user(
+    username: str,
+    tier: str,
+    body: Dict[str, Any],
+    data_limit_gb: int,
+    idempotency_key: str,
+    max_retries: int,
+    request_timeout: float,
+) -> MarzbanUserResponse:
+    """
+    POST a prepared body to /api/user with token refresh and retries.
+    """
+    url = _USER_URL
+    deadline = time.monotonic() + RETRY_BUDGET
+
+    # Shared keep-alive session (see marzban._http)
+    session = await get_session()
+    refreshed = False
+    last_error: Optional[Exception] = None
+
+    for attempt in range(1, max_retries + 1):
+        try:
+            # Token per tier
+            auth = await get_auth_headers(tier=tier, session=session)
+            headers = {**auth, "Idempotency-Key": idempotency_key}
+
+            async with asyncio.timeout(request_timeout):
+                resp = await session.post(url, data=orjson.dumps(body), headers=headers)
+                try:
+                    raw = await resp.read()
+                finally:
+                    resp.release()
+
+            if 200 <= resp.status < 300:
+                user = _response_decoder.decode(raw)
+                # Always inject data_limit_gb for bot display
+                user.data_limit_gb = data_limit_gb
+                logger.info(
+                    "✅ Created user %s (tier=%s, group=%s, data=%sGB, expire=%s)",
+                    username,
+                    tier,
+                    body["group_ids"],
+                    data_limit_gb,
+                    body["expire"],
+                )
+                return user
+
+            elif resp.status == 401 and not refreshed:
+                logger.warning("⚠️ Token expired, refreshing and retrying...")
+                invalidate(tier, auth)
+                refreshed = True
+                continue
+
+            else:
+                msg = f"Marzban error {resp.status}: {raw.decode(errors='replace')}"
+                logger.error(msg)
+                # return a typed response including data_limit_gb for bot handling
+                user = _response_decoder.decode(raw)
+                user.data_limit_gb = data_limit_gb
+                return user
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            last_error = e
+            logger.warning("Network issue (attempt %d/%d): %s", attempt, max_retries, e)
+            if not await backoff(attempt, max_retries, deadline):
+                break
+
+    raise RuntimeError(f"Failed to create user after {max_retries} attempts") from last_error
 
 
 # ---------- Core Function ----------
@@ -95,6 +191,7 @@ async def create_user(
     note: str,
     idempotency_key: Optional[str] = None,
     max_retries: int = 3,
+    request_timeout: float = 15.0,
 ) -> MarzbanUserResponse:
     """
     Create a user on Marzban based on provided info.
@@ -105,8 +202,12 @@ async def create_user(
         data_limit_gb (int): Data limit in GB (e.g., 40 for 40GB).
         expire_days (int): Duration in days (e.g., 30 for 1 month).
         note (str): Optional description or product note.
-        idempotency_key (str, optional): Prevent duplicate creation.
+        idempotency_key (str, optional): Prevent duplicate creation. Defaults to a
+            deterministic key from (username, plan_days, today), so re-POSTs in the
+            retry loop and double taps are deduplicated by Marzban.
         max_retries (int): Retry attempts on failure.
+        request_timeout (float): Deadline in seconds for each attempt (pass the
+            handler's remaining budget when it has one).
 
     Returns:
         MarzbanUserResponse: Parsed user response (with data_limit_gb and subscription_url).
@@ -114,87 +215,39 @@ async def create_user(
 
     # Normalize tier & map to group
     tier = tier.lower().strip()
-    group_map = {"vip": [4], "test": [5], "free": [6]}
-    if tier not in group_map:
-        raise ValueError(f"Invalid tier '{tier}'. Must be one of {list(group_map.keys())}")
+    try:
+        group_ids = _GROUP_MAP[tier]
+    except KeyError:
+        raise ValueError(f"Invalid tier '{tier}'. Must be one of {list(_GROUP_MAP.keys())}") from None
 
     # Compute dynamic fields
     username = f"CipherGate_{tier}_{user_id}"
     data_limit_bytes = gb_to_bytes(data_limit_gb)
     expire_date = make_expire_date(plan_days)
 
-    # Build payload
-    payload = {
+    # Build request body directly (all fields are bot-controlled)
+    body = {
         "username": username,
         "status": "active",
         "data_limit": data_limit_bytes,
         "expire": expire_date,
-        "note": note,
-        "group_ids": group_map[tier],
-        "proxy_settings": {
-            "vless": {"flow": "xtls-rprx-vision"},
-            "shadowsocks": {"method": "chacha20-ietf-poly1305"},
-        },
+        "note": note or "",
+        "group_ids": group_ids,
+        "proxy_settings": _PROXY_SETTINGS,
     }
 
-    # Validate before sending
-    body = CreateUserPayload(**payload).model_dump(exclude_none=True)
-
-    host = settings.MARZBAN_HOST.rstrip("/")
-    if not host:
-        raise RuntimeError("MARZBAN_HOST not defined in .env")
-
-    url = f"{host}/api/user"
-    timeout = aiohttp.ClientTimeout(total=15)
-    backoff = 1.5
-
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        force_refresh = False
-        last_error: Optional[Exception] = None
-
-        for attempt in range(1, max_retries + 1):
-            try:
-                # Token per tier
-                token = await get_token(tier=tier, force=force_refresh, session=session)
-                headers = {
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json",
-                    "Accept": "application/json",
-                }
-                if idempotency_key:
-                    headers["Idempotency-Key"] = str(idempotency_key)
-
-                async with session.post(url, json=body, headers=headers) as resp:
-                    data = await resp.json(content_type=None)
-
-                    # Always inject data_limit_gb for bot display
-                    data["data_limit_gb"] = data_limit_gb
-
-                    if 200 <= resp.status < 300:
-                        logger.info(
-                            "✅ Created user %s (tier=%s, group=%s, data=%s, expire=%dGB)",
-                            username,
-                            tier,
-                            group_map[tier],
-                            data_limit_gb,
-                            expire_date,
-                        )
-                        return MarzbanUserResponse(**data)
-
-                    elif resp.status == 401 and not force_refresh:
-                        logger.warning("⚠️ Token expired, refreshing and retrying...")
-                        force_refresh = True
-                        continue
-
-                    else:
-                        msg = f"Marzban error {resp.status}: {data}"
-                        logger.error(msg)
-                        # return a typed response including data_limit_gb for bot handling
-                        return MarzbanUserResponse(**data)
-
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                last_error = e
-                logger.warning("Network issue (attempt %d/%d): %s", attempt, max_retries, e)
-                await asyncio.sleep(backoff * attempt)
-
-        raise RuntimeError(f"Failed to create user after {max_retries} attempts") from last_error
+    # Always send an Idempotency-Key so retrying the POST is safe
+    if not idempotency_key:
+        seed = f"{username}:{plan_days}:{date.today().isoformat()}"
+        idempotency_key = hashlib.blake2b(seed.encode(), digest_size=16).hexdigest()
+    idempotency_key = str(idempotency_key)
+
+    # Share one in-flight request per username (e.g. a double-tapped "buy" button)
+    task = _inflight.get(username)
+    if task is None:
+        task = asyncio.create_task(
+            _post_user(username, tier, body, data_limit_gb, idempotency_key, max_retries, request_timeout)
+        )
+        _inflight[username] = task
+        task.add_done_callback(lambda _: _inflight.pop(username, None))
+    return await asyncio.shield(task)
@@ -1,32 +1,54 @@
 """
 Marzban token helper (multi-tier, async-safe).
-Use get_token(tier="free"|"test"|"vip") to obtain an access token for the requested Marzban account.
-Credentials and host are loaded from utils.config (via dotenv).
+Use get_token(tier="free"|"test"|"vip") to obtain an access token for the requested Marzban account,
+or get_auth_headers(tier=...) for ready-to-send request headers built once per token.
+Credentials and host are loaded from utils.config (pydantic-settings, .env).
 """
 
 import time
 import base64
-import json
 import asyncio
 import logging
+from dataclasses import dataclass
 from typing import Optional, Dict
 
 import aiohttp
+import orjson
+from marzban._http import BASE_URL, get_session
 from utils.config import settings
 
 # Setup logger
 logger = logging.getLogger(__name__)
 
+# Token endpoint (precomputed once)
+_TOKEN_URL = f"{BASE_URL}/api/admin/token"
+
+
+@dataclass(slots=True)
+class _TierCache:
+    """Cached token state for one tier (headers = prebuilt request headers)."""
+
+    token: Optional[str] = None
+    expires_at: float = 0.0
+    headers: Optional[Dict[str, str]] = None
+
+
 # Cache tokens per tier to avoid repeated authentication requests
-_token_cache: Dict[str, Dict[str, object]] = {
-    "free": {"token": None, "expires_at": 0},
-    "test": {"token": None, "expires_at": 0},
-    "vip": {"token": None, "expires_at": 0},
+_token_cache: Dict[str, _TierCache] = {
+    "free": _TierCache(),
+    "test": _TierCache(),
+    "vip": _TierCache(),
 }
 
 # Lock to prevent concurrent token refresh collisions
 _token_lock = asyncio.Lock()
 
+# In-flight refresh per tier (forced callers wait on it instead of re-authenticating)
+_refresh_events: Dict[str, asyncio.Event] = {}
+
+# Background tasks that refresh each tier's token shortly before it expires
+_refresh_tasks: Dict[str, asyncio.Task] = {}
+
 
 def _creds_for(tier: str) -> Dict[str, str]:
     """
@@ -45,17 +67,19 @@ def _creds_for(tier: str) -> Dict[str, str]:
 def _extract_exp_from_jwt(token: str) -> Optional[int]:
     """
     Extract 'exp' (expiry timestamp) from a JWT token payload.
+    Only called when a new token is fetched; cache hits use the stored expires_at.
     """
     try:
-        parts = token.split(".")
-        if len(parts) < 2:
+        # Slice out the payload segment without allocating a list of parts
+        i1 = token.find(".")
+        if i1 < 0:
             return None
-        payload_b64 = parts[1]
-        rem = len(payload_b64) % 4
-        if rem:
-            payload_b64 += "=" * (4 - rem)
-        payload_bytes = base64.urlsafe_b64decode(payload_b64.encode("utf-8"))
-        payload = json.loads(payload_bytes.decode("utf-8"))
+        i2 = token.find(".", i1 + 1)
+        if i2 < 0:
+            i2 = len(token)
+        payload_b64 = token[i1 + 1:i2]
+        payload_b64 += "=" * (-len(payload_b64) % 4)
+        payload = orjson.loads(base64.urlsafe_b64decode(payload_b64))
         exp = payload.get("exp")
         if isinstance(exp, str) and exp.isdigit():
             exp = int(exp)
@@ -69,17 +93,17 @@ def _extract_exp_from_jwt(token: str) -> Optional[int]:
     return None
 
 
-async def _request_token(session: aiohttp.ClientSession, host: str, username: str, password: str) -> Dict:
+async def _request_token(session: aiohttp.ClientSession, username: str, password: str) -> Dict:
     """
     Send HTTP POST request to Marzban's /api/admin/token endpoint.
     """
-    base = host.rstrip("/")
-    url = f"{base}/api/admin/token"
-    data = {"username": username, "password": password}
+    data = orjson.dumps({"username": username, "password": password})
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
 
     try:
-        async with session.post(url, json=data, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-            body = await resp.json(content_type=None)
+        async with asyncio.timeout(10):
+            async with session.post(_TOKEN_URL, data=data, headers=headers) as resp:
+                body = orjson.loads(await resp.read())
             return {"status": resp.status, "body": body}
     except asyncio.TimeoutError:
         raise RuntimeError("Timeout while connecting to Marzban host.")
@@ -87,6 +111,28 @@ async def _request_token(session: aiohttp.ClientSession, host: str, username: st
         raise RuntimeError(f"Connection error: {e}") from e
 
 
+def _schedule_refresh(tier: str, delay: float) -> None:
+    """
+    (Re)schedule the background refresh for a tier, replacing any pending one.
+    """
+    task = _refresh_tasks.get(tier)
+    if task is not None and not task.done() and task is not asyncio.current_task():
+        task.cancel()
+    _refresh_tasks[tier] = asyncio.create_task(_auto_refresh(tier, delay))
+
+
+async def _auto_refresh(tier: str, delay: float) -> None:
+    """
+    Sleep `delay` seconds, then force a token refresh for the tier.
+    """
+    await asyncio.sleep(delay)
+    try:
+        await get_token(tier=tier, force=True)
+    except (RuntimeError, ValueError) as e:
+        # Next on-demand get_token() will retry and reschedule
+        logger.warning(f"Background token refresh failed for '{tier}': {e}")
+
+
 async def get_token(tier: str = "free", force: bool = False, session: Optional[aiohttp.ClientSession] = None) -> str:
     """
     Retrieve an access token for a given Marzban tier (free/test/vip).
@@ -96,35 +142,35 @@ async def get_token(tier: str = "free", force: bool = False, session: Optional[a
     if t not in _token_cache:
         raise ValueError("tier must be one of: 'free', 'test', 'vip'")
 
+    if force:
+        pending = _refresh_events.get(t)
+        if pending is not None:
+            # Another caller is already refreshing this tier: share its result
+            await pending.wait()
+            force = False
+
     now = time.time()
     cached = _token_cache[t]
-    if not force and cached.get("token") and cached.get("expires_at", 0) > now + 5:
+    if not force and cached.token and cached.expires_at > now + 5:
         logger.debug(f"Using cached Marzban token for tier '{t}'")
-        return cached["token"]
+        return cached.token
 
     async with _token_lock:
         # Double-check inside lock
-        cached = _token_cache[t]
-        if not force and cached.get("token") and cached.get("expires_at", 0) > time.time() + 5:
-            return cached["token"]
+        if not force and cached.token and cached.expires_at > time.time() + 5:
+            return cached.token
 
         creds = _creds_for(t)
         username, password = creds["username"], creds["password"]
         if not username or not password:
             raise RuntimeError(f"Missing credentials for '{t}' in .env file")
 
-        host = settings.MARZBAN_HOST
-        if not host:
-            raise RuntimeError("MARZBAN_HOST is not defined in .env")
-
-        close_session = False
         if session is None:
-            timeout = aiohttp.ClientTimeout(total=10)
-            session = aiohttp.ClientSession(timeout=timeout)
-            close_session = True
+            session = await get_session()
 
+        event = _refresh_events[t] = asyncio.Event()
         try:
-            res = await _request_token(session, host, username, password)
+            res = await _request_token(session, username, password)
             status, body = res.get("status"), res.get("body")
 
             if not (200 <= status < 300):
@@ -137,12 +183,51 @@ async def get_token(tier: str = "free", force: bool = False, session: Optional[a
             exp_ts = _extract_exp_from_jwt(token)
             ttl = max(60, int(exp_ts - time.time() - 5)) if exp_ts else 3600
 
-            _token_cache[t]["token"] = token
-            _token_cache[t]["expires_at"] = now + ttl
+            cached.token = token
+            cached.expires_at = now + ttl
+            cached.headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            }
+
+            # Refresh ahead of expiry so user requests never wait on re-auth
+            _schedule_refresh(t, max(ttl - 60, 30))
 
             logger.info(f"New Marzban token cached for '{t}' (valid {ttl:.0f}s)")
             return token
-
         finally:
-            if close_session:
-                await session.close()
+            event.set()
+            _refresh_events.pop(t, None)
+
+
+async def get_auth_headers(tier: str = "free", force: bool = False, session: Optional[aiohttp.ClientSession] = None) -> Dict[str, str]:
+    """
+    Return prebuilt request headers (Authorization/Content-Type/Accept) for a tier.
+    The dict is shared with the token cache — copy it before adding headers.
+    """
+    await get_token(tier=tier, force=force, session=session)
+    return _token_cache[tier.lower()].headers
+
+
+def invalidate(tier: str, headers: Optional[Dict[str, str]] = None) -> None:
+    """
+    Mark a tier's cached token as expired (call on 401 instead of force=True).
+    Pass the headers that got the 401: if another caller already refreshed the
+    token, the new one is kept, so concurrent 401s coalesce into one refresh.
+    """
+    cached = _token_cache[tier.lower()]
+    if headers is not None and cached.headers is not headers:
+        return
+    cached.expires_at = 0.0
+
+
+async def cancel_refresh_tasks() -> None:
+    """
+    Cancel all background token refresh tasks (call once on bot shutdown).
+    """
+    tasks = [task for task in _refresh_tasks.values() if not task.done()]
+    _refresh_tasks.clear()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
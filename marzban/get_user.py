@@ -5,9 +5,11 @@ Async helper to retrieve a user's information from the Marzban panel.
 
 Features:
 - Automatically builds username (CipherGate_{tier}_{user_id})
-- Uses tier-based token from marzban.get_token.get_token()
+- Uses tier-based auth headers from marzban.get_token.get_auth_headers()
 - Handles token refresh (401) and retry with backoff
-- Returns parsed MarzbanUserInfo (status, expire, remaining_gb, etc.)
+- Hedges slow GETs with a second request and takes the first success
+- Concurrent calls for the same username share one in-flight request
+- Returns MarzbanUserInfo decoded by msgspec (status, expire, remaining_gb, etc.)
 
 Usage Example:
 --------------
@@ -19,57 +21,71 @@ print(user.username, user.expire, user.remaining_gb)
 
 import asyncio
 import logging
-from typing import Optional, Dict, Any
+import time
+from functools import cached_property
+from typing import Optional, Dict, Any, Tuple
 
 import aiohttp
-from pydantic import BaseModel, Field
+import msgspec
 
-from marzban.get_token import get_token
-from utils.config import settings
+from marzban._http import BASE_URL, RETRY_BUDGET, backoff, get_session
+from marzban.get_token import get_auth_headers, invalidate
 from utils.qrcode_utils import generate_qr_code
-from utils.byte_utils import bytes_to_gb
+from utils.byte_utils import GB_PER_BYTE
 
 logger = logging.getLogger(__name__)
 
+# User endpoint (precomputed once)
+_USER_URL = f"{BASE_URL}/api/user"
+
+# Valid account tiers
+_VALID_TIERS = frozenset({"free", "test", "vip"})
+
+# Seconds to wait for a GET before sending a duplicate (hedged) request
+_HEDGE_DELAY = 1.0
+
+# In-flight lookups keyed by username (concurrent duplicates share one)
+_inflight: Dict[str, "asyncio.Task[MarzbanUserInfo]"] = {}
+
 
 # ---------- Models ----------
-class MarzbanUserInfo(BaseModel):
-    """Response model for GET /api/user/{username} (simplified, without lifetime fields)."""
+class MarzbanUserInfo(msgspec.Struct, kw_only=True, dict=True):
+    """
+    Response model for GET /api/user/{username} (simplified, without lifetime fields).
+    Decoded straight from JSON bytes by msgspec; unknown fields are ignored.
+    """
 
-    id: Optional[int]
+    id: Optional[int] = None
     username: str
     status: str
-    data_limit: Optional[int] = Field(0, description="Maximum data in bytes")
-    used_traffic: Optional[int] = Field(0, description="Used traffic in bytes")
-    expire: Optional[str]
-    created_at: Optional[str]
-    edit_at: Optional[str]
-    online_at: Optional[str]
+    data_limit: Optional[int] = 0  # Maximum data in bytes
+    used_traffic: Optional[int] = 0  # Used traffic in bytes
+    expire: Optional[str] = None
+    created_at: Optional[str] = None
+    edit_at: Optional[str] = None
+    online_at: Optional[str] = None
     subscription_url: Optional[str] = None
-    # ✅ Added field: proxy_settings
-    proxy_settings: Optional[Dict[str, Dict[str, Any]]] = Field(
-        default_factory=dict,
-        description="Contains all VPN protocol settings (vmess, vless, trojan, shadowsocks)."
-    )
+    # All VPN protocol settings (vmess, vless, trojan, shadowsocks)
+    proxy_settings: Optional[Dict[str, Dict[str, Any]]] = msgspec.field(default_factory=dict)
 
-    # --- Derived properties for bot display ---
-    @property
+    # --- Derived properties for bot display (computed once per response) ---
+    @cached_property
     def data_limit_gb(self) -> float:
         """Return total data limit in GB (rounded to 1 decimal)."""
-        return bytes_to_gb(self.data_limit or 0)
+        return round((self.data_limit or 0) * GB_PER_BYTE, 1)
 
-    @property
+    @cached_property
     def remaining_gb(self) -> float:
         """Return remaining traffic in GB (rounded to 1 decimal)."""
         if not self.data_limit:
             return 0.0
         remaining = self.data_limit - (self.used_traffic or 0)
-        return bytes_to_gb(max(remaining, 0))
+        return round(max(remaining, 0) * GB_PER_BYTE, 1)
 
-    @property
+    @cached_property
     def used_gb(self) -> float:
         """Return used traffic in GB (rounded to 1 decimal)."""
-        return bytes_to_gb(self.used_traffic or 0)
+        return round((self.used_traffic or 0) * GB_PER_BYTE, 1)
 
     # ---------- Derived Field ----------
     @property
@@ -94,8 +110,112 @@ class MarzbanUserInfo(BaseModel):
         except OSError as e:
             logger.warning("⚠️ File or I/O error while generating QR for %s: %s", self.username, e)
 
-    class Config:
-        extra = "allow"
+
+# Reusable decoder: JSON bytes -> MarzbanUserInfo in one pass
+_user_decoder = msgspec.json.Decoder(MarzbanUserInfo)
+
+
+# ---------- Request ----------
+async def _get_once(
+    session: aiohttp.ClientSession,
+    url: str,
+    headers: Dict[str, str],
+    request_timeout: float,
+) -> Tuple[int, bytes]:
+    """
+    Send one GET and return (status, raw body bytes).
+    """
+    async with asyncio.timeout(request_timeout):
+        resp = await session.get(url, headers=headers)
+        try:
+            raw = await resp.read()
+        finally:
+            resp.release()
+    return resp.status, raw
+
+
+async def _hedged_get(
+    session: aiohttp.ClientSession,
+    url: str,
+    headers: Dict[str, str],
+    request_timeout: float,
+) -> Tuple[int, bytes]:
+    """
+    GET with a hedge: if the first request has not finished after _HEDGE_DELAY
+    seconds, fire a second identical one and take whichever succeeds first.
+    Safe because the GET is idempotent (never used for create_user).
+    """
+    first = asyncio.create_task(_get_once(session, url, headers, request_timeout))
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=_HEDGE_DELAY)
+        if done:
+            return first.result()
+
+        tasks.add(asyncio.create_task(_get_once(session, url, headers, request_timeout)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+
+        # Both attempts failed: surface the first one's error
+        return first.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def _fetch_user(username: str, tier: str, max_retries: int, request_timeout: float) -> MarzbanUserInfo:
+    """
+    GET /api/user/{username} with token refresh and retries.
+    """
+    url = f"{_USER_URL}/{username}"
+    deadline = time.monotonic() + RETRY_BUDGET
+
+    # Shared keep-alive session (see marzban._http)
+    session = await get_session()
+    refreshed = False
+    last_error: Optional[Exception] = None
+
+    for attempt in range(1, max_retries + 1):
+        try:
+            headers = await get_auth_headers(tier=tier, session=session)
+
+            status, raw = await _hedged_get(session, url, headers, request_timeout)
+
+            if 200 <= status < 300:
+                try:
+                    user = _user_decoder.decode(raw)
+                except msgspec.DecodeError as e:
+                    raise ValueError(f"Invalid user payload for {username}: {e}") from e
+                logger.info("✅ Retrieved info for %s (tier=%s)", username, tier)
+                return user
+
+            elif status == 401 and not refreshed:
+                logger.warning("⚠️ Token expired, refreshing and retrying...")
+                invalidate(tier, headers)
+                refreshed = True
+                continue
+
+            else:
+                msg = f"Marzban error {status}: {raw.decode(errors='replace')}"
+                logger.error(msg)
+                raise RuntimeError(msg)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            last_error = e
+            logger.warning(
+                "Network issue (attempt %d/%d): %s", attempt, max_retries, e
+            )
+            if not await backoff(attempt, max_retries, deadline):
+                break
+
+    raise RuntimeError(
+        f"Failed to retrieve user '{username}' after {max_retries} attempts"
+    ) from last_error
 
 
 # ---------- Core Function ----------
@@ -103,6 +223,7 @@ async def get_user(
     user_id: int,
     tier: str,
     max_retries: int = 3,
+    request_timeout: float = 10.0,
 ) -> MarzbanUserInfo:
     """
     Fetch detailed user information from Marzban.
@@ -111,6 +232,8 @@ async def get_user(
         user_id (int): Telegram user ID used to build the Marzban username.
         tier (str): Account tier ("free", "test", or "vip").
         max_retries (int): Number of retry attempts on network failure.
+        request_timeout (float): Deadline in seconds for each attempt (pass the
+            handler's remaining budget when it has one).
 
     Returns:
         MarzbanUserInfo: Parsed Marzban user information.
@@ -119,56 +242,16 @@ async def get_user(
         RuntimeError: On unrecoverable network or API errors.
     """
     tier = tier.lower().strip()
-    if tier not in {"free", "test", "vip"}:
+    if tier not in _VALID_TIERS:
         raise ValueError("tier must be one of: free, test, vip")
 
     # Build username using the same naming pattern as in create_user
     username = f"CipherGate_{tier}_{user_id}"
 
-    host = settings.MARZBAN_HOST.rstrip("/")
-    if not host:
-        raise RuntimeError("MARZBAN_HOST not defined in .env")
-
-    url = f"{host}/api/user/{username}"
-    timeout = aiohttp.ClientTimeout(total=10)
-    backoff = 1.5
-
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        force_refresh = False
-        last_error: Optional[Exception] = None
-
-        for attempt in range(1, max_retries + 1):
-            try:
-                token = await get_token(tier=tier, force=force_refresh, session=session)
-                headers = {
-                    "Authorization": f"Bearer {token}",
-                    "Accept": "application/json",
-                }
-
-                async with session.get(url, headers=headers) as resp:
-                    data = await resp.json(content_type=None)
-
-                    if 200 <= resp.status < 300:
-                        logger.info("✅ Retrieved info for %s (tier=%s)", username, tier)
-                        return MarzbanUserInfo(**data)
-
-                    elif resp.status == 401 and not force_refresh:
-                        logger.warning("⚠️ Token expired, refreshing and retrying...")
-                        force_refresh = True
-                        continue
-
-                    else:
-                        msg = f"Marzban error {resp.status}: {data}"
-                        logger.error(msg)
-                        raise RuntimeError(msg)
-
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                last_error = e
-                logger.warning(
-                    "Network issue (attempt %d/%d): %s", attempt, max_retries, e
-                )
-                await asyncio.sleep(backoff * attempt)
-
-        raise RuntimeError(
-            f"Failed to retrieve user '{username}' after {max_retries} attempts"
-        ) from last_error
+    # Share one in-flight request per username
+    task = _inflight.get(username)
+    if task is None:
+        task = asyncio.create_task(_fetch_user(username, tier, max_retries, request_timeout))
+        _inflight[username] = task
+        task.add_done_callback(lambda _: _inflight.pop(username, None))
+    return await asyncio.shield(task)
@@ -4,47 +4,76 @@ modify_user.py
 Async helper to modify (update or extend) an existing user on the Marzban panel.
 
 Features:
-- Uses cached JWT tokens from marzban.get_token.get_token()
+- Uses cached auth headers from marzban.get_token.get_auth_headers()
 - Automatically builds username (CipherGate_{tier}_{user_id})
 - Updates user fields: data limit, expire, group, note, and proxy settings
 - Always includes all required fields (so nothing resets unintentionally)
+- Caches the proxy_settings it wrote for 60s (back-to-back modifies skip get_user)
 - Handles token refresh (401) and retry with backoff
 - Returns parsed MarzbanUserResponse (with updated data)
 """
 
 import asyncio
 import logging
-from typing import Optional, Dict, Any, Literal
+import time
+from functools import cached_property
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Literal, Mapping, Tuple
 
 import aiohttp
-from pydantic import BaseModel, Field
+import msgspec
+import orjson
+from pydantic import BaseModel, ConfigDict, Field
 
-from marzban.get_token import get_token
-from utils.config import settings
-from utils.time_utils import make_expire_date
+from marzban._http import BASE_URL, RETRY_BUDGET, backoff, get_session
+from marzban.get_token import get_auth_headers, invalidate
+from utils.time_utils import format_expire, make_expire_timestamp
 from marzban.get_user import get_user
 from utils.qrcode_utils import generate_qr_code
-from utils.byte_utils import bytes_to_gb, gb_to_bytes
+from utils.byte_utils import GB_PER_BYTE, gb_to_bytes
 
 logger = logging.getLogger(__name__)
 
 
+# User endpoint (precomputed once)
+_USER_URL = f"{BASE_URL}/api/user"
+
+
+# ---------- Constants ----------
+# Tier -> Marzban group mapping (read-only; tuples serialize as JSON arrays)
+_GROUP_MAP: Mapping[str, Tuple[int, ...]] = MappingProxyType({"vip": (4,), "test": (5,), "free": (6,)})
+
+# Seconds a user's proxy_settings stay cached after a successful modify
+_PROXY_CACHE_TTL = 60.0
+
+# username -> (expires_at monotonic, proxy_settings last written by modify_user)
+_proxy_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+
+def forget_proxy_settings(username: str) -> None:
+    """
+    Drop a user's cached proxy_settings (call after anything else changes them, e.g. revoke_sub).
+    """
+    _proxy_cache.pop(username, None)
+
+
 # ---------- Models ----------
 
 class ProxySettings(BaseModel):
     """Nested VPN protocol settings model (optional)."""
 
+    model_config = ConfigDict(extra="allow")
+
     vmess: Optional[Dict[str, Any]] = None
     vless: Optional[Dict[str, Any]] = None
     trojan: Optional[Dict[str, Any]] = None
     shadowsocks: Optional[Dict[str, Any]] = None
 
-    class Config:
-        extra = "allow"
-
 
 class ModifyUserPayload(BaseModel):
-    """Validates Marzban /api/user/{username} PUT request body."""
+    """Schema of the Marzban /api/user/{username} PUT request body (reference; not validated per call)."""
+
+    model_config = ConfigDict(extra="allow")
 
     username: str = Field(..., min_length=3, max_length=32)
     status: Literal["active"] = "active"
@@ -55,45 +84,41 @@ class ModifyUserPayload(BaseModel):
     group_ids: Optional[list[int]] = Field(default_factory=list)
     proxy_settings: Optional[ProxySettings] = None
 
-    class Config:
-        extra = "allow"
-
 
-class MarzbanUserResponse(BaseModel):
-    """Response model for GET /api/user/{username} (simplified, without lifetime fields)."""
+class MarzbanUserResponse(msgspec.Struct, kw_only=True, dict=True):
+    """Response model for PUT /api/user/{username} (simplified, without lifetime fields), decoded by msgspec."""
 
-    id: Optional[int]
+    id: Optional[int] = None
     username: str
     status: str
-    data_limit: Optional[int] = Field(0, description="Maximum data in bytes")
-    used_traffic: Optional[int] = Field(0, description="Used traffic in bytes")
-    expire: Optional[str]
-    created_at: Optional[str]
-    edit_at: Optional[str]
-    online_at: Optional[str]
+    data_limit: Optional[int] = 0  # Maximum data in bytes
+    used_traffic: Optional[int] = 0  # Used traffic in bytes
+    expire: Optional[str] = None
+    created_at: Optional[str] = None
+    edit_at: Optional[str] = None
+    online_at: Optional[str] = None
     subscription_url: Optional[str] = None
 
-    # --- Derived properties for bot display ---
-    @property
+    # --- Derived properties for bot display (computed once per response) ---
+    @cached_property
     def data_limit_gb(self) -> float:
         """Return total data limit in GB (rounded to 1 decimal)."""
-        return bytes_to_gb(self.data_limit or 0)
+        return round((self.data_limit or 0) * GB_PER_BYTE, 1)
 
-    @property
+    @cached_property
     def remaining_gb(self) -> float:
         """Return remaining traffic in GB (rounded to 1 decimal)."""
         if not self.data_limit:
             return 0.0
         remaining = self.data_limit - (self.used_traffic or 0)
-        return bytes_to_gb(max(remaining, 0))
+        return round(max(remaining, 0) * GB_PER_BYTE, 1)
 
-    @property
+    @cached_property
     def used_gb(self) -> float:
         """Return used traffic in GB (rounded to 1 decimal)."""
-        return bytes_to_gb(self.used_traffic or 0)
+        return round((self.used_traffic or 0) * GB_PER_BYTE, 1)
 
     # ---------- Derived Field ----------
-    @property
     async def qr_image(self) -> Optional[bytes]:
         """
         Generate and return a QR code (PNG bytes) for the user's subscription URL.
@@ -115,8 +140,9 @@ class MarzbanUserResponse(BaseModel):
         except OSError as e:
             logger.warning("⚠️ File or I/O error while generating QR for %s: %s", self.username, e)
 
-    class Config:
-        extra = "allow"
+
+# Reusable decoder: JSON bytes -> MarzbanUserResponse in one pass (unknown fields ignored)
+_response_decoder = msgspec.json.Decoder(MarzbanUserResponse)
 
 
 # ---------- Core Function ----------
@@ -127,6 +153,7 @@ async def modify_user(
     plan_days: int,
     idempotency_key: Optional[str] = None,
     max_retries: int = 3,
+    request_timeout: float = 15.0,
 ) -> MarzbanUserResponse:
     """
     Modify an existing user on Marzban.
@@ -139,6 +166,8 @@ async def modify_user(
         note (str): Optional note or product name.
         idempotency_key (str, optional): Prevent duplicate modifications.
         max_retries (int): Number of retry attempts on failure.
+        request_timeout (float): Deadline in seconds for each attempt (pass the
+            handler's remaining budget when it has one).
 
     Returns:
         MarzbanUserResponse: Updated user information.
@@ -146,91 +175,98 @@ async def modify_user(
 
     # Normalize tier & map to correct Marzban group
     tier = tier.lower().strip()
-    group_map = {"vip": [4], "test": [5], "free": [6]}
-    if tier not in group_map:
-        raise ValueError(f"Invalid tier '{tier}'. Must be one of {list(group_map.keys())}")
+    try:
+        group_ids = _GROUP_MAP[tier]
+    except KeyError:
+        raise ValueError(f"Invalid tier '{tier}'. Must be one of {list(_GROUP_MAP.keys())}") from None
 
     username = f"CipherGate_{tier}_{user_id}"
     data_limit_bytes = gb_to_bytes(data_limit_gb)
-    expire_date = make_expire_date(plan_days)
+    expire_ts = make_expire_timestamp(plan_days)
 
-    # --- Get current user info first ---
-    try:
-        current_user = await get_user(user_id=user_id, tier=tier)
-        current_proxy_settings = current_user.proxy_settings or {}
-    except aiohttp.ClientError as e:
-        logger.warning("⚠️ Network error while fetching user data: %s", e)
-        current_proxy_settings = {}
-    except asyncio.TimeoutError:
-        logger.warning("⚠️ Request timed out while fetching user data")
-        current_proxy_settings = {}
-    except ValueError as e:
-        logger.warning("⚠️ Invalid response parsing user data: %s", e)
-        current_proxy_settings = {}
-
-    if hasattr(current_proxy_settings, "model_dump"):
-        current_proxy_settings = current_proxy_settings.model_dump()
-
-    # Prepare payload exactly like Marzban expects
-    payload = {
+    # Shared keep-alive session (see marzban._http)
+    session = await get_session()
+
+    # --- Reuse proxy settings written by a recent modify (skips the get_user round trip) ---
+    cached = _proxy_cache.get(username)
+    if cached is not None and cached[0] > time.monotonic():
+        current_proxy_settings = cached[1]
+    else:
+        _proxy_cache.pop(username, None)  # expired (or absent)
+
+        # --- Get current user info first ---
+        try:
+            current_user = await get_user(user_id=user_id, tier=tier)
+            # get_user already returns proxy_settings as a plain dict (no model_dump needed)
+            current_proxy_settings = current_user.proxy_settings or {}
+        except aiohttp.ClientError as e:
+            logger.warning("⚠️ Network error while fetching user data: %s", e)
+            current_proxy_settings = {}
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Request timed out while fetching user data")
+            current_proxy_settings = {}
+        except ValueError as e:
+            logger.warning("⚠️ Invalid response parsing user data: %s", e)
+            current_proxy_settings = {}
+
+    # Build request body directly, exactly like Marzban expects (no field is ever None;
+    # every value is bot-controlled, so the body is not re-validated per call).
+    # Marzban expects expire as an ISO 8601 string: the epoch is formatted only here (memoized)
+    body = {
         "username": username,
         "status": "active",
         "data_limit": data_limit_bytes,
-        "expire": expire_date,
+        "expire": format_expire(expire_ts),
         "note": "",
         "data_limit_reset_strategy": "no_reset",
-        "group_ids": group_map[tier],
+        "group_ids": group_ids,
         "proxy_settings": current_proxy_settings,  # ✅ use existing proxy settings
     }
 
-    body = ModifyUserPayload(**payload).model_dump(exclude_none=True)
-
-    host = settings.MARZBAN_HOST.rstrip("/")
-    if not host:
-        raise RuntimeError("MARZBAN_HOST not defined in .env")
-
-    url = f"{host}/api/user/{username}"
-    timeout = aiohttp.ClientTimeout(total=15)
-    backoff = 1.5
-
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        force_refresh = False
-        last_error: Optional[Exception] = None
-
-        for attempt in range(1, max_retries + 1):
-            try:
-                # Get valid JWT token per tier
-                token = await get_token(tier=tier, force=force_refresh, session=session)
-                headers = {
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json",
-                    "Accept": "application/json",
-                }
-                if idempotency_key:
-                    headers["Idempotency-Key"] = str(idempotency_key)
-
-                async with session.put(url, json=body, headers=headers) as resp:
-                    data = await resp.json(content_type=None)
-
-
-                    if 200 <= resp.status < 300:
-                        data["data_limit_gb"] = data_limit_gb
-                        logger.info("✅ Modified user %s | Tier=%s | Data=%sGB | Expire=%s)", username, tier, data_limit_gb, expire_date)
-                        return MarzbanUserResponse(**data)
-
-                    elif resp.status == 401 and not force_refresh:
-                        logger.warning("⚠️ Token expired, refreshing and retrying...")
-                        force_refresh = True
-                        continue
-
-                    else:
-                        msg = f"Marzban error {resp.status}: {data}"
-                        logger.error(msg)
-                        raise RuntimeError(msg)
-
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                last_error = e
-                logger.warning("Network issue (attempt %d/%d): %s", attempt, max_retries, e)
-                await asyncio.sleep(backoff * attempt)
-
-        raise RuntimeError(f"Failed to modify user after {max_retries} attempts") from last_error
+    url = f"{_USER_URL}/{username}"
+
+    refreshed = False
+    last_error: Optional[Exception] = None
+    deadline = time.monotonic() + RETRY_BUDGET
+
+    for attempt in range(1, max_retries + 1):
+        try:
+            # Cached per-tier auth headers (shared dict: copied before adding headers)
+            auth = await get_auth_headers(tier=tier, session=session)
+            headers = {**auth, "Idempotency-Key": str(idempotency_key)} if idempotency_key else auth
+
+            async with asyncio.timeout(request_timeout):
+                resp = await session.put(url, data=orjson.dumps(body), headers=headers)
+                try:
+                    raw = await resp.read()
+                finally:
+                    resp.release()
+
+            if 200 <= resp.status < 300:
+                logger.info("✅ Modified user %s | Tier=%s | Data=%sGB | Expire=%s)", username, tier, data_limit_gb, body["expire"])
+                user = _response_decoder.decode(raw)
+                # The just-written settings are the current ones (never cache the empty fallback)
+                if current_proxy_settings:
+                    _proxy_cache[username] = (time.monotonic() + _PROXY_CACHE_TTL, current_proxy_settings)
+                return user
+
+            elif resp.status == 401 and not refreshed:
+                logger.warning("⚠️ Token expired, refreshing and retrying...")
+                forget_proxy_settings(username)
+                invalidate(tier, auth)
+                refreshed = True
+                continue
+
+            else:
+                forget_proxy_settings(username)
+                msg = f"Marzban error {resp.status}: {raw.decode(errors='replace')}"
+                logger.error(msg)
+                raise RuntimeError(msg)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            last_error = e
+            logger.warning("Network issue (attempt %d/%d): %s", attempt, max_retries, e)
+            if not await backoff(attempt, max_retries, deadline):
+                break
+
+    raise RuntimeError(f"Failed to modify user after {max_retries} attempts") from last_error
@@ -5,7 +5,7 @@ Async helper to revoke (invalidate and regenerate) an existing user's
 subscription and proxy configuration on the Marzban panel.
 
 Features:
-- Uses cached JWT tokens from marzban.get_token.get_token()
+- Uses cached auth headers from marzban.get_token.get_auth_headers()
 - Automatically builds username (CipherGate_{tier}_{user_id})
 - Calls POST /api/user/{username}/revoke_sub
 - Returns full MarzbanUserResponse (including traffic info and QR image)
@@ -14,53 +14,62 @@ Features:
 
 import asyncio
 import logging
+import time
+from functools import cached_property
 from typing import Optional, Dict, Any
 
 import aiohttp
-from pydantic import BaseModel, Field
+import msgspec
 
-from marzban.get_token import get_token
-from utils.config import settings
+from marzban._http import BASE_URL, RETRY_BUDGET, backoff, get_session
+from marzban.get_token import get_auth_headers, invalidate
+from marzban.modify_user import forget_proxy_settings
 from utils.qrcode_utils import generate_qr_code
-from utils.byte_utils import bytes_to_gb
+from utils.byte_utils import GB_PER_BYTE
 
 logger = logging.getLogger(__name__)
 
+# User endpoint (precomputed once)
+_USER_URL = f"{BASE_URL}/api/user"
+
+# Valid account tiers
+_VALID_TIERS = frozenset({"free", "test", "vip"})
+
 
 # ---------- Models ----------
-class MarzbanUserResponse(BaseModel):
-    """Full Marzban API response model for revoke_sub (with QR generation)."""
+class MarzbanUserResponse(msgspec.Struct, kw_only=True, dict=True):
+    """Full Marzban API response model for revoke_sub (with QR generation), decoded by msgspec."""
 
-    id: Optional[int]
+    id: Optional[int] = None
     username: str
     status: str
-    data_limit: Optional[int] = Field(0, description="Maximum data in bytes")
-    used_traffic: Optional[int] = Field(0, description="Used traffic in bytes")
-    expire: Optional[str]
-    created_at: Optional[str]
-    edit_at: Optional[str]
-    online_at: Optional[str]
+    data_limit: Optional[int] = 0  # Maximum data in bytes
+    used_traffic: Optional[int] = 0  # Used traffic in bytes
+    expire: Optional[str] = None
+    created_at: Optional[str] = None
+    edit_at: Optional[str] = None
+    online_at: Optional[str] = None
     subscription_url: Optional[str] = None
     proxy_settings: Optional[Dict[str, Any]] = None
 
-    # --- Derived properties for bot display ---
-    @property
+    # --- Derived properties for bot display (computed once per response) ---
+    @cached_property
     def data_limit_gb(self) -> float:
         """Return total data limit in GB (rounded to 1 decimal)."""
-        return bytes_to_gb(self.data_limit or 0)
+        return round((self.data_limit or 0) * GB_PER_BYTE, 1)
 
-    @property
+    @cached_property
     def remaining_gb(self) -> float:
         """Return remaining traffic in GB (rounded to 1 decimal)."""
         if not self.data_limit:
             return 0.0
         remaining = self.data_limit - (self.used_traffic or 0)
-        return bytes_to_gb(max(remaining, 0))
+        return round(max(remaining, 0) * GB_PER_BYTE, 1)
 
-    @property
+    @cached_property
     def used_gb(self) -> float:
         """Return used traffic in GB (rounded to 1 decimal)."""
-        return bytes_to_gb(self.used_traffic or 0)
+        return round((self.used_traffic or 0) * GB_PER_BYTE, 1)
 
     # ---------- Derived Field ----------
     async def qr_image(self) -> Optional[bytes]:
@@ -88,12 +97,17 @@ class MarzbanUserResponse(BaseModel):
         return None
 
 
+# Reusable decoder: JSON bytes -> MarzbanUserResponse in one pass (unknown fields ignored)
+_response_decoder = msgspec.json.Decoder(MarzbanUserResponse)
+
+
 # ---------- Core Function ----------
 async def revoke_user_sub(
     user_id: int,
     tier: str,
     idempotency_key: Optional[str] = None,
     max_retries: int = 3,
+    request_timeout: float = 10.0,
 ) -> MarzbanUserResponse:
     """
     Revoke (reset) a user's subscription and proxies on Marzban.
@@ -103,59 +117,61 @@ async def revoke_user_sub(
         tier (str): Account tier ("free", "test", "vip").
         idempotency_key (str, optional): Unique key for duplicate prevention.
         max_retries (int): Number of retry attempts on network failure.
+        request_timeout (float): Deadline in seconds for each attempt (pass the
+            handler's remaining budget when it has one).
 
     Returns:
         MarzbanUserResponse: User info with new subscription link, data, and QR code.
     """
 
     tier = tier.lower().strip()
-    if tier not in {"free", "test", "vip"}:
+    if tier not in _VALID_TIERS:
         raise ValueError("tier must be one of: free, test, vip")
 
     username = f"CipherGate_{tier}_{user_id}"
 
-    host = settings.MARZBAN_HOST.rstrip("/")
-    if not host:
-        raise RuntimeError("MARZBAN_HOST not defined in .env")
-
-    url = f"{host}/api/user/{username}/revoke_sub"
-    timeout = aiohttp.ClientTimeout(total=10)
-    backoff = 1.5
-
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        force_refresh = False
-        last_error: Optional[Exception] = None
-
-        for attempt in range(1, max_retries + 1):
-            try:
-                token = await get_token(tier=tier, force=force_refresh, session=session)
-                headers = {
-                    "Authorization": f"Bearer {token}",
-                    "Accept": "application/json",
-                }
-                if idempotency_key:
-                    headers["Idempotency-Key"] = str(idempotency_key)
-
-                async with session.post(url, headers=headers) as resp:
-                    data = await resp.json(content_type=None)
-
-                    if 200 <= resp.status < 300:
-                        logger.info("🔄 Revoked subscription for %s (tier=%s)", username, tier)
-                        return MarzbanUserResponse(**data)
-
-                    elif resp.status == 401 and not force_refresh:
-                        logger.warning("⚠️ Token expired, refreshing and retrying...")
-                        force_refresh = True
-                        continue
-
-                    else:
-                        msg = f"Marzban error {resp.status}: {data}"
-                        logger.error(msg)
-                        raise RuntimeError(msg)
-
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                last_error = e
-                logger.warning("Network issue (attempt %d/%d): %s", attempt, max_retries, e)
-                await asyncio.sleep(backoff * attempt)
-
-        raise RuntimeError(f"Failed to revoke subscription after {max_retries} attempts") from last_error
+    url = f"{_USER_URL}/{username}/revoke_sub"
+
+    # Shared keep-alive session (see marzban._http)
+    session = await get_session()
+    refreshed = False
+    last_error: Optional[Exception] = None
+    deadline = time.monotonic() + RETRY_BUDGET
+
+    for attempt in range(1, max_retries + 1):
+        try:
+            # Cached per-tier auth headers (shared dict: copied before adding headers)
+            auth = await get_auth_headers(tier=tier, session=session)
+            headers = {**auth, "Idempotency-Key": str(idempotency_key)} if idempotency_key else auth
+
+            async with asyncio.timeout(request_timeout):
+                resp = await session.post(url, headers=headers)
+                try:
+                    raw = await resp.read()
+                finally:
+                    resp.release()
+
+            if 200 <= resp.status < 300:
+                # Revoking regenerates proxy credentials: drop modify_user's cached copy
+                forget_proxy_settings(username)
+                logger.info("🔄 Revoked subscription for %s (tier=%s)", username, tier)
+                return _response_decoder.decode(raw)
+
+            elif resp.status == 401 and not refreshed:
+                logger.warning("⚠️ Token expired, refreshing and retrying...")
+                invalidate(tier, auth)
+                refreshed = True
+                continue
+
+            else:
+                msg = f"Marzban error {resp.status}: {raw.decode(errors='replace')}"
+                logger.error(msg)
+                raise RuntimeError(msg)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            last_error = e
+            logger.warning("Network issue (attempt %d/%d): %s", attempt, max_retries, e)
+            if not await backoff(attempt, max_retries, deadline):
+                break
+
+    raise RuntimeError(f"Failed to revoke subscription after {max_retries} attempts") from last_error
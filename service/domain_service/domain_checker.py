@@ -7,9 +7,9 @@ Features:
 - Query domain A records against a public resolver (Google 8.8.8.8) and an Iranian resolver (5.200.200.200).
 - Analyze results and decide: "ok", "filtered", "inconclusive", "error".
 - Persist last check status into domain_store.touch_last_check(...)
-- Notify admins (settings.ADMINS) via aiogram.Bot when a domain is detected as filtered.
+- Notify admins (settings.admin_ids) via aiogram.Bot when a domain is detected as filtered.
 - periodic_worker(bot) runs forever and checks domains according to each domain's check_interval_minutes.
-- safe concurrency (Semaphore) + ThreadPoolExecutor for blocking dnspython calls.
+- safe concurrency (Semaphore) + dnspython's asyncio resolver (no worker threads).
 
 Usage:
 - import and call asyncio.create_task(periodic_worker(bot)) when your bot starts,
@@ -19,46 +19,60 @@ Prereqs: pip install dnspython
 """
 
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Any, Tuple, Optional, List
 
+import dns.asyncresolver
 import dns.resolver
 import dns.exception
 from aiogram import Bot
 
-from services.domain_store import list_all_domains, touch_last_check
+from services.domain_store import flush_domains, list_all_domains, touch_last_check
 from utils.logger import logger        # optional; implement logger (loguru recommended)
-from utils.config import settings     # expects settings.ADMINS (list of ints/strings)
+from utils.config import settings     # expects settings.admin_ids (parsed from ADMINS)
 
 # Constants
 IR_DNS = "5.200.200.200"   # Iranian resolver to check against
 PUBLIC_DNS = "8.8.8.8"     # Public resolver (Google)
 DNS_TIMEOUT = 4.0          # per-query timeout seconds
-MAX_CONCURRENCY = 6        # limit concurrent DNS checks
-THREADPOOL_MAX = 10       # max workers for blocking DNS calls
+MAX_CONCURRENCY = 6        # limit concurrent DNS checks (default per cycle)
 
-# Thread executor and semaphore (module-level)
-_executor = ThreadPoolExecutor(max_workers=THREADPOOL_MAX)
-_semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+def _make_resolver(nameserver: str, timeout: float = DNS_TIMEOUT) -> dns.asyncresolver.Resolver:
+    """
+    Build an async resolver that only asks `nameserver` (no /etc/resolv.conf).
+    """
+    resolver = dns.asyncresolver.Resolver(configure=False)
+    resolver.nameservers = [nameserver]
+    resolver.timeout = timeout
+    resolver.lifetime = timeout
+    return resolver
+
+
+# Resolvers for the fixed nameservers, built once and shared by all checks
+_RESOLVERS: Dict[str, dns.asyncresolver.Resolver] = {
+    PUBLIC_DNS: _make_resolver(PUBLIC_DNS),
+    IR_DNS: _make_resolver(IR_DNS),
+}
 
 
 # ----------------------
-# Blocking DNS query
+# Async DNS query
 # ----------------------
-def _query_dns_blocking(domain: str, nameserver: str, timeout: float = DNS_TIMEOUT) -> Dict[str, Any]:
+async def query_dns(domain: str, nameserver: str, timeout: float = DNS_TIMEOUT) -> Dict[str, Any]:
     """
-    Blocking function that queries A records for `domain` using `nameserver`.
+    Query A records for `domain` using `nameserver` (native asyncio sockets, no threads).
     Returns a dict with keys: answers (list), rcode (0 or textual), error (string or None).
     """
-    resolver = dns.resolver.Resolver(configure=False)
-    resolver.nameservers = [nameserver]
-    resolver.timeout = timeout
-    resolver.lifetime = timeout
+    resolver = _RESOLVERS.get(nameserver) if timeout == DNS_TIMEOUT else None
+    if resolver is None:
+        resolver = _make_resolver(nameserver, timeout)
     out: Dict[str, Any] = {"answers": [], "rcode": None, "error": None}
     try:
-        answers = resolver.resolve(domain, "A")
-        out["answers"] = [a.to_text() for a in answers]
+        answers = await resolver.resolve(domain, "A")
+        # Sorted once here so analyze_results can compare plain lists
+        out["answers"] = sorted(a.to_text() for a in answers)
         out["rcode"] = 0
     except dns.resolver.NXDOMAIN:
         out["rcode"] = "NXDOMAIN"
@@ -71,21 +85,13 @@ def _query_dns_blocking(domain: str, nameserver: str, timeout: float = DNS_TIMEO
     return out
 
 
-async def query_dns(domain: str, nameserver: str, timeout: float = DNS_TIMEOUT) -> Dict[str, Any]:
-    """
-    Async wrapper for _query_dns_blocking using ThreadPoolExecutor.
-    """
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(_executor, _query_dns_blocking, domain, nameserver, timeout)
-
-
 # ----------------------
 # Analysis logic
 # ----------------------
 def analyze_results(public: Dict[str, Any], iran: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
     """
     Compare public vs iran resolver responses and return:
-      - "ok"           : public and iran answers match (sets equal)
+      - "ok"           : public and iran answers match (same sorted IPs)
       - "filtered"     : public has answers but iran lacks them or differs
       - "inconclusive" : public has no answers (or both no-answer/timeouts)
       - "error"        : both sides have errors
@@ -103,8 +109,8 @@ def analyze_results(public: Dict[str, Any], iran: Dict[str, Any]) -> Tuple[str,
     if pub_ans:
         # iran has answers too
         if iran_ans:
-            # exact set equality -> ok
-            if set(pub_ans) == set(iran_ans):
+            # answers are pre-sorted by query_dns -> plain list equality
+            if pub_ans == iran_ans:
                 return "ok", details
             # different IPs -> likely filtered / redirected
             return "filtered", details
@@ -119,6 +125,8 @@ def analyze_results(public: Dict[str, Any], iran: Dict[str, Any]) -> Tuple[str,
 # ----------------------
 # Helper: should we check now?
 # ----------------------
+# last_checked_at rarely changes between cycles: memoize parsed values (datetimes are immutable)
+@lru_cache(maxsize=4096)
 def _parse_iso(iso: Optional[str]) -> Optional[datetime]:
     if not iso:
         return None
@@ -153,9 +161,22 @@ def _should_check(domain_entry: Dict[str, Any]) -> bool:
 # ----------------------
 # Single domain check
 # ----------------------
-async def check_domain_entry(domain_entry: Dict[str, Any], bot: Optional[Bot] = None):
+async def _notify_admin(bot: Bot, admin: Any, text: str) -> None:
+    """
+    Send one alert; int() runs inside the coroutine so a bad admin id fails only its own send.
     """
-    Check a single domain entry:
+    await bot.send_message(int(admin), text, parse_mode="Markdown")
+
+
+async def check_domain_entry(
+    domain_entry: Dict[str, Any],
+    bot: Optional[Bot] = None,
+    *,
+    semaphore: asyncio.Semaphore,
+):
+    """
+    Check a single domain entry (under `semaphore`, which the caller must share
+    across the whole cycle for the limit to mean anything):
       - query public and iran DNS
       - analyze
       - persist status with touch_last_check
@@ -165,9 +186,9 @@ async def check_domain_entry(domain_entry: Dict[str, Any], bot: Optional[Bot] =
     if not name:
         return
 
-    async with _semaphore:
+    async with semaphore:
         try:
-            # Run both queries concurrently (they each use threadpool)
+            # Run both queries concurrently
             task_public = asyncio.create_task(query_dns(name, PUBLIC_DNS))
             task_iran = asyncio.create_task(query_dns(name, IR_DNS))
             public, iran = await asyncio.gather(task_public, task_iran)
@@ -188,14 +209,17 @@ async def check_domain_entry(domain_entry: Dict[str, Any], bot: Optional[Bot] =
                     f"Iran answers: {iran.get('answers') or iran.get('rcode') or iran.get('error')}\n"
                     f"Check time: {datetime.now(timezone.utc).isoformat()}"
                 )
-                # settings.ADMINS expected to be iterable of ids (int or str)
-                admins = getattr(settings, "ADMINS", []) or []
+                # parsed once from the comma-separated ADMINS setting
+                admins = tuple(settings.admin_ids)
                 if bot:
-                    for admin in admins:
-                        try:
-                            await bot.send_message(int(admin), text, parse_mode="Markdown")
-                        except Exception:
-                            logger.exception("Failed to notify admin %s about domain %s", admin, name)
+                    # Send to all admins concurrently; failures are logged per admin
+                    results = await asyncio.gather(
+                        *(_notify_admin(bot, admin, text) for admin in admins),
+                        return_exceptions=True,
+                    )
+                    for admin, r in zip(admins, results):
+                        if isinstance(r, Exception):
+                            logger.error("Failed to notify admin %s about domain %s: %r", admin, name, r)
                 else:
                     # Bot not provided — log as fallback
                     logger.warning("Bot not provided: filtered domain %s — admins: %s", name, admins)
@@ -212,30 +236,42 @@ async def run_cycle(bot: Optional[Bot] = None, concurrency_limit: Optional[int]
     Run one checking cycle over all domains (using list_all_domains()).
     Only domains where _should_check(...) is True will be queried.
     """
-    if concurrency_limit:
-        global _semaphore
-        _semaphore = asyncio.Semaphore(concurrency_limit)
+    limit = concurrency_limit or MAX_CONCURRENCY
+    # One semaphore per cycle (passed to every check, never rebound mid-flight)
+    semaphore = asyncio.Semaphore(limit)
 
     domains = list_all_domains()
     if not domains:
         logger.info("domain_checker: no domains to check")
         return
 
-    tasks: List[asyncio.Task] = []
+    eligible: List[Dict[str, Any]] = []
     for d in domains:
         try:
             if _should_check(d):
-                tasks.append(asyncio.create_task(check_domain_entry(d, bot=bot)))
+                eligible.append(d)
         except Exception:
             logger.exception("Failed to schedule check for domain entry: %s", d.get("name"))
 
-    if tasks:
+    # Check in bounded batches so a large domain list never queues thousands of tasks at once
+    batch_size = limit * 2
+    for start in range(0, len(eligible), batch_size):
+        batch = eligible[start:start + batch_size]
         # gather and swallow exceptions individually
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        results = await asyncio.gather(
+            *(check_domain_entry(d, bot=bot, semaphore=semaphore) for d in batch),
+            return_exceptions=True,
+        )
         for r in results:
             if isinstance(r, Exception):
                 logger.exception("domain check task raised: %s", r)
 
+    # Persist last_checked_at bumps of unchanged domains once per cycle
+    try:
+        flush_domains()
+    except Exception:
+        logger.exception("domain_checker: failed to flush domain store")
+
 
 # ----------------------
 # Periodic worker
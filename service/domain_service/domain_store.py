@@ -9,132 +9,419 @@ JSON-backed domain store (categorized):
       US: [ ... ]
 
 Provides:
- - load_domains()
+ - load_domains()              # cached by file mtime/size; returns a mutable copy
  - save_domains()
- - list_all_domains()           # flat list across all sections
+ - list_all_domains()           # flat tuple across all sections (list/find helpers return read-only views)
  - list_by_section(section)     # 'management'|'subscription'
  - list_countries()             # list of country codes available
  - list_by_country(code)
  - find_domain(name)            # search across all places
  - add_domain(section, ...)     # section='management'|'subscription'|'countries'
  - remove_domain(name)          # removes all occurrences
+ - remove_domains(names)        # bulk remove with a single save
  - update_domain(name, **fields)
  - touch_last_check(name, status, details)
+ - flush_domains()              # write pending last_checked_at-only updates
+ - domain_transaction()         # batch many mutations into one locked write
 """
 
+import copy
 import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from typing import List, Dict, Optional, Any
+from types import MappingProxyType
+from typing import List, Dict, Optional, Any, Tuple, Iterable, Iterator, Mapping
 from filelock import FileLock, Timeout
 from datetime import datetime, timezone
 
+# orjson is much faster than stdlib json for the whole-file dump/parse (optional)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 ROOT = Path(__file__).resolve().parent
 DOMAINS_FILE = ROOT / "domains.json"
 LOCK_FILE = ROOT / "domains.json.lock"
-LOCK_TIMEOUT = 5  # seconds
+LOCK_TIMEOUT = 5  # seconds (total budget across attempts)
+LOCK_ATTEMPTS = 3  # lock attempts before giving up (backoff in between)
+LOCK_POLL_INTERVAL = 0.01  # seconds between lock polls (filelock default is 0.05)
+TOUCH_FLUSH_SECONDS = 300  # max age of unsaved last_checked_at-only updates
+
+# Fields update_domain() may change
+_ALLOWED_UPDATE_FIELDS = frozenset({"label", "purpose", "check_interval_minutes", "notify_admins", "notes"})
 
 DEFAULT_SCHEMA = {"domains": {"management": [], "subscription": [], "countries": {}}}
 
+# Parsed domains.json keyed by file identity (st_mtime_ns, st_size).
+# "data" is shared by all readers and must never be mutated in place.
+# "by_name" maps domain name -> [(place, country_code, index), ...] in search order
+# (management, subscription, countries); paths stay valid on deep copies of "data".
+# "dirty_since" is set when touch_last_check only bumped last_checked_at in memory
+# (the one in-place change allowed on "data"); flush_domains() writes it out.
+# "flat" / "flat_by_name" are the deduplicated list_all_domains() view (first seen wins),
+# holding read-only MappingProxyType views of the entries.
+# "raw" is the serialized form of "data" (None after an in-memory bump): mutable private
+# copies are parsed from it, which is several times faster than copy.deepcopy.
+_CACHE: Dict[str, Any] = {
+    "mtime": None, "size": None, "data": None, "raw": None, "by_name": {}, "dirty_since": None,
+    "flat": [], "flat_by_name": {},
+}
+_cache_lock = threading.RLock()
+
+# One (reentrant) FileLock object for the module, so a transaction can hold it
+# while load/save inside the block acquire it again
+_file_lock = FileLock(str(LOCK_FILE))
+
+
+def _acquire_file_lock():
+    """
+    Acquire the writer lock with a short poll interval, retrying with jittered
+    exponential backoff on Timeout. Returns the filelock proxy (use with `with`).
+    """
+    open_tx = _open_tx
+    if open_tx is not None and open_tx["thread"] == threading.get_ident() and open_tx is not _active_tx():
+        # Another task on this thread holds a transaction: the FileLock is reentrant per
+        # thread so it would let us in, and waiting would stall the event loop -> refuse
+        raise RuntimeError("domains.json is locked by a domain_transaction() in another task")
+
+    per_attempt = LOCK_TIMEOUT / LOCK_ATTEMPTS
+    for attempt in range(LOCK_ATTEMPTS):
+        try:
+            return _file_lock.acquire(timeout=per_attempt, poll_interval=LOCK_POLL_INTERVAL)
+        except Timeout:
+            if attempt == LOCK_ATTEMPTS - 1:
+                raise
+            time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+
+
+# Active domain_transaction() state for the current context: asyncio tasks on the
+# bot's single thread each get their own (see below)
+_tx_var: ContextVar[Optional[Dict[str, Any]]] = ContextVar("domain_tx", default=None)
+
+# The transaction currently holding the file lock in this process (None if none);
+# writers from any other context on its thread are refused by _acquire_file_lock()
+_open_tx: Optional[Dict[str, Any]] = None
+
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def _dumps(struct: Dict[str, Any]) -> bytes:
+    """Serialize to UTF-8 JSON bytes (2-space indent, non-ASCII kept as-is)."""
+    if orjson is not None:
+        return orjson.dumps(struct, option=orjson.OPT_INDENT_2)
+    return json.dumps(struct, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def _loads(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
 def _ensure_file_exists():
     if not DOMAINS_FILE.exists():
         DOMAINS_FILE.parent.mkdir(parents=True, exist_ok=True)
-        DOMAINS_FILE.write_text(json.dumps(DEFAULT_SCHEMA, indent=2, ensure_ascii=False))
+        DOMAINS_FILE.write_bytes(_dumps(DEFAULT_SCHEMA))
 
 
-def load_domains() -> Dict[str, Any]:
-    """Load the whole JSON structure safely."""
+def _file_key() -> Tuple[int, int]:
+    st = DOMAINS_FILE.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+DomainPath = Tuple[str, Optional[str], int]
+
+
+def _build_index(data: Dict[str, Any]) -> Dict[str, List[DomainPath]]:
+    """Walk all sections once and map each name to where it occurs."""
+    dom = data["domains"]
+    by_name: Dict[str, List[DomainPath]] = {}
+    for place in ("management", "subscription"):
+        for i, d in enumerate(dom.get(place, [])):
+            by_name.setdefault(d.get("name"), []).append((place, None, i))
+    for code, lst in dom.get("countries", {}).items():
+        for i, d in enumerate(lst):
+            by_name.setdefault(d.get("name"), []).append(("countries", code, i))
+    return by_name
+
+
+def _container(data: Dict[str, Any], place: str, code: Optional[str]) -> List[Dict[str, Any]]:
+    dom = data["domains"]
+    return dom["countries"][code] if place == "countries" else dom[place]
+
+
+def _build_flat(data: Dict[str, Any]) -> Dict[str, Mapping[str, Any]]:
+    """name -> read-only view of the first entry with that name, in search order."""
+    dom = data["domains"]
+    flat_by_name: Dict[str, Dict[str, Any]] = {}
+    for lst in (dom.get("management", []), dom.get("subscription", []), *dom.get("countries", {}).values()):
+        for d in lst:
+            name = d.get("name")
+            if name and name not in flat_by_name:
+                flat_by_name[name] = MappingProxyType(d)
+    return flat_by_name
+
+
+def _store_cache(key: Tuple[int, int], data: Dict[str, Any], raw: bytes):
+    by_name = _build_index(data)
+    flat_by_name = _build_flat(data)
+    with _cache_lock:
+        _CACHE["mtime"], _CACHE["size"] = key
+        _CACHE["data"] = data
+        _CACHE["raw"] = raw
+        _CACHE["by_name"] = by_name
+        _CACHE["flat"] = tuple(flat_by_name.values())
+        _CACHE["flat_by_name"] = flat_by_name
+        _CACHE["dirty_since"] = None
+
+
+def _flat_view() -> Tuple[Tuple[Mapping[str, Any], ...], Dict[str, Mapping[str, Any]]]:
+    """The deduplicated (flat, flat_by_name) view, built once per cache generation."""
+    tx = _active_tx()
+    if tx is not None:
+        flat_by_name = _build_flat(tx["struct"])
+        return tuple(flat_by_name.values()), flat_by_name
+    data, _ = _read_snapshot()
+    with _cache_lock:
+        if _CACHE["data"] is data:
+            return _CACHE["flat"], _CACHE["flat_by_name"]
+    flat_by_name = _build_flat(data)
+    return tuple(flat_by_name.values()), flat_by_name
+
+
+def _read_snapshot() -> Tuple[Dict[str, Any], Dict[str, List[DomainPath]]]:
+    """
+    Return (structure, name index), re-reading the file only when its mtime/size changed.
+    Both are shared: callers must treat them as read-only.
+    """
+    tx = _active_tx()
+    if tx is not None:
+        return tx["struct"], _tx_index(tx)
+
     _ensure_file_exists()
-    lock = FileLock(str(LOCK_FILE))
+    key = _file_key()
+    with _cache_lock:
+        if _CACHE["data"] is not None and (_CACHE["mtime"], _CACHE["size"]) == key:
+            return _CACHE["data"], _CACHE["by_name"]
+
+    # No lock needed: writers replace the file atomically, so a reader always sees a
+    # complete version. fstat of the opened file gives the key of exactly that version.
+    with open(DOMAINS_FILE, "rb") as f:
+        st = os.fstat(f.fileno())
+        key = (st.st_mtime_ns, st.st_size)
+        raw = f.read()
+    data = _loads(raw)
+
+    # normalize structure (raw is re-serialized only if that changed anything)
+    if "domains" not in data:
+        struct = copy.deepcopy(DEFAULT_SCHEMA)
+        raw = _dumps(struct)
+    else:
+        dom = data["domains"]
+        # ensure keys exist (anything besides "domains" is dropped)
+        if not {"management", "subscription", "countries"} <= dom.keys() or len(data) != 1:
+            dom.setdefault("management", [])
+            dom.setdefault("subscription", [])
+            dom.setdefault("countries", {})
+            raw = None
+        # country codes are canonical upper-case (add_domain writes them that way);
+        # fold any hand-edited lower/mixed-case keys once per load
+        countries = dom["countries"]
+        if any(code != code.upper() for code in countries):
+            merged: Dict[str, List[Dict[str, Any]]] = {}
+            for code, lst in countries.items():
+                merged.setdefault(code.upper(), []).extend(lst)
+            dom["countries"] = merged
+            raw = None
+        struct = {"domains": dom}
+        if raw is None:
+            raw = _dumps(struct)
+
+    _store_cache(key, struct, raw)
+    with _cache_lock:
+        return _CACHE["data"], _CACHE["by_name"]
+
+
+def _read_cached() -> Dict[str, Any]:
+    """Shared parsed structure (read-only), see _read_snapshot()."""
+    return _read_snapshot()[0]
+
+
+def _private_copy(data: Dict[str, Any]) -> Dict[str, Any]:
+    """A mutable deep copy of a snapshot, parsed from its cached bytes when it is the cached one."""
+    with _cache_lock:
+        if _CACHE["data"] is data:
+            if _CACHE["raw"] is None:
+                # touch_last_check bumped entries in memory: serialize once for later copies
+                _CACHE["raw"] = _dumps(data)
+            raw = _CACHE["raw"]
+        else:
+            raw = None
+    # parsing happens outside the lock (the bytes are immutable)
+    return _loads(raw if raw is not None else _dumps(data))
+
+
+def _load_indexed() -> Tuple[Dict[str, Any], Dict[str, List[DomainPath]]]:
+    """A mutable copy of the structure plus the name index that matches it."""
+    tx = _active_tx()
+    if tx is not None:
+        return tx["struct"], _tx_index(tx)
+    data, by_name = _read_snapshot()
+    return _private_copy(data), by_name
+
+
+def load_domains() -> Dict[str, Any]:
+    """Load the whole JSON structure safely (a private copy the caller may mutate)."""
+    tx = _active_tx()
+    if tx is not None:
+        return tx["struct"]
+    return _private_copy(_read_cached())
+
+
+def _fsync_dir(path: Path):
+    """fsync a directory so a rename inside it survives a crash (best effort)."""
     try:
-        with lock.acquire(timeout=LOCK_TIMEOUT):
-            with open(DOMAINS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                # normalize structure
-                if "domains" not in data:
-                    return DEFAULT_SCHEMA.copy()
-                dom = data["domains"]
-                # ensure keys exist
-                dom.setdefault("management", [])
-                dom.setdefault("subscription", [])
-                dom.setdefault("countries", {})
-                return {"domains": dom}
-    except Timeout:
-        raise RuntimeError("Could not acquire file lock to read domains.json")
+        dir_fd = os.open(str(path), os.O_DIRECTORY)
+    except (OSError, AttributeError):
+        # O_DIRECTORY is unavailable on Windows; some network filesystems refuse it
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
 
+def _write_file(struct: Dict[str, Any], durable: bool = True):
+    _write_raw(_dumps(struct), durable=durable)
 
-def save_domains(struct: Dict[str, Any]):
-    """Atomically save the whole structure."""
+
+def _write_raw(raw: bytes, durable: bool = True):
     _ensure_file_exists()
-    lock = FileLock(str(LOCK_FILE))
     try:
-        with lock.acquire(timeout=LOCK_TIMEOUT):
+        with _acquire_file_lock():
             tmp = DOMAINS_FILE.with_suffix(".json.tmp")
-            with open(tmp, "w", encoding="utf-8") as f:
-                json.dump(struct, f, indent=2, ensure_ascii=False)
+            with open(tmp, "wb") as f:
+                f.write(raw)
                 f.flush()
+                # data must be on disk before the rename, or a crash can leave an empty file
+                os.fsync(f.fileno())
             tmp.replace(DOMAINS_FILE)
+            if durable:
+                _fsync_dir(DOMAINS_FILE.parent)
+            # the just-written bytes are the current version (parsed: callers keep their struct)
+            _store_cache(_file_key(), _loads(raw), raw)
     except Timeout:
         raise RuntimeError("Could not acquire file lock to write domains.json")
 
 
+def save_domains(struct: Dict[str, Any], durable: bool = True):
+    """
+    Atomically save the whole structure (deferred to commit inside a transaction).
+    durable=False skips the directory fsync: a crash may lose this write (the previous
+    version stays intact), which is fine for high-frequency status updates.
+    """
+    tx = _active_tx()
+    if tx is not None:
+        tx["struct"] = struct
+        tx["by_name"] = None  # positions may have changed; rebuilt on next lookup
+        tx["dirty"] = True
+        tx["durable"] = tx["durable"] or durable
+        return
+    _write_file(struct, durable=durable)
+
+
+# ---- transactions ----
+def _active_tx() -> Optional[Dict[str, Any]]:
+    return _tx_var.get()
+
+
+def _tx_index(tx: Dict[str, Any]) -> Dict[str, List[DomainPath]]:
+    if tx["by_name"] is None:
+        tx["by_name"] = _build_index(tx["struct"])
+    return tx["by_name"]
+
+
+@contextmanager
+def domain_transaction() -> Iterator[None]:
+    """
+    Batch several mutations into one locked load and one write:
+
+        with domain_transaction():
+            for name in names:
+                touch_last_check(name, "ok")
+
+    The file lock is held for the whole block; load/save inside it work on one
+    in-memory structure that is written once on exit (only if something was saved,
+    and not at all if the block raises). Nested blocks join the outer one. The
+    transaction belongs to the task that opened it; other tasks' writes raise
+    RuntimeError until it ends.
+    """
+    global _open_tx
+    if _active_tx() is not None:
+        yield
+        return
+
+    try:
+        _acquire_file_lock()
+    except Timeout:
+        raise RuntimeError("Could not acquire file lock to update domains.json")
+
+    try:
+        data, by_name = _read_snapshot()
+        tx = {"struct": _private_copy(data), "by_name": by_name, "dirty": False, "durable": False,
+              "thread": threading.get_ident()}
+        token = _tx_var.set(tx)
+        _open_tx = tx
+        try:
+            yield
+        finally:
+            _open_tx = None
+            _tx_var.reset(token)
+        # commit (synchronous: no other task runs before the lock is released)
+        if tx["dirty"]:
+            _write_file(tx["struct"], durable=tx["durable"])
+    finally:
+        _file_lock.release()
+
+
 # ---- listing helpers ----
-def list_all_domains() -> List[Dict[str, Any]]:
-    """Return flat list of all domain objects (deduplicated by name, first seen wins)."""
-    data = load_domains()["domains"]
-    seen = set()
-    out = []
-    # management
-    for d in data.get("management", []):
-        name = d.get("name")
-        if name and name not in seen:
-            out.append(d)
-            seen.add(name)
-    # subscription
-    for d in data.get("subscription", []):
-        name = d.get("name")
-        if name and name not in seen:
-            out.append(d)
-            seen.add(name)
-    # countries (each country list)
-    for country_list in data.get("countries", {}).values():
-        for d in country_list:
-            name = d.get("name")
-            if name and name not in seen:
-                out.append(d)
-                seen.add(name)
-    return out
+def list_all_domains() -> Tuple[Mapping[str, Any], ...]:
+    """Return all domain objects (deduplicated by name, first seen wins) as read-only views."""
+    return _flat_view()[0]
 
 
-def list_by_section(section: str) -> List[Dict[str, Any]]:
+def list_by_section(section: str) -> Tuple[Mapping[str, Any], ...]:
     s = section.lower()
-    data = load_domains()["domains"]
+    data = _read_cached()["domains"]
     if s in ("management", "subscription"):
-        return data.get(s, [])
+        return tuple(MappingProxyType(d) for d in data.get(s, ()))
     raise ValueError("Invalid section. Use 'management' or 'subscription'.")
 
 
 def list_countries() -> List[str]:
-    data = load_domains()["domains"]
+    data = _read_cached()["domains"]
     return list(data.get("countries", {}).keys())
 
 
-def list_by_country(code: str) -> List[Dict[str, Any]]:
-    data = load_domains()["domains"]
-    return data.get("countries", {}).get(code, [])
+def list_by_country(code: str) -> Tuple[Mapping[str, Any], ...]:
+    """Domains of one country; `code` is case-insensitive (keys are stored upper-case)."""
+    return tuple(MappingProxyType(d) for d in _read_cached()["domains"]["countries"].get(code.upper(), ()))
 
 
 # ---- find/add/remove/update ----
-def find_domain(name: str) -> Optional[Dict[str, Any]]:
-    """Search across all sections and countries, return first match."""
-    for d in list_all_domains():
-        if d.get("name") == name:
-            return d
-    return None
+def find_domain(name: str) -> Optional[Mapping[str, Any]]:
+    """Search across all sections and countries, return a read-only view of the first match (O(1) lookup)."""
+    return _flat_view()[1].get(name)
 
 
 def _ensure_domain_entry(name: str, label: Optional[str], purpose: str,
@@ -165,128 +452,173 @@ def add_domain(section: str,
     section: 'management', 'subscription', or 'countries'
     if section == 'countries', country must be provided (country code string)
     """
-    struct = load_domains()
+    s = section.lower()
+    if s == "countries":
+        if not country:
+            raise ValueError("country code required when adding to 'countries' section")
+        country = country.upper()
+    elif s not in ("management", "subscription"):
+        raise ValueError("Invalid section. Use 'management','subscription' or 'countries'")
+
+    struct, by_name = _load_indexed()
     data = struct["domains"]
 
+    # duplicate check in the target list via the name index (no scan)
+    places = {(place, code) for place, code, _ in by_name.get(name, ())}
+
     entry = _ensure_domain_entry(name, label, purpose, check_interval_minutes, notify_admins, notes)
 
-    s = section.lower()
     if s in ("management", "subscription"):
-        # check duplicate in this list
-        if any(d.get("name") == name for d in data.get(s, [])):
+        if (s, None) in places:
             raise ValueError(f"Domain {name} already exists in {s}")
         data[s].append(entry)
-    elif s == "countries":
-        if not country:
-            raise ValueError("country code required when adding to 'countries' section")
-        country = country.upper()
-        cdict = data.setdefault("countries", {})
-        lst = cdict.setdefault(country, [])
-        if any(d.get("name") == name for d in lst):
-            raise ValueError(f"Domain {name} already exists in countries.{country}")
-        lst.append(entry)
     else:
-        raise ValueError("Invalid section. Use 'management','subscription' or 'countries'")
+        if ("countries", country) in places:
+            raise ValueError(f"Domain {name} already exists in countries.{country}")
+        data["countries"].setdefault(country, []).append(entry)
 
     save_domains(struct)
     return entry
 
 
-def remove_domain(name: str) -> int:
+def remove_domains(names: Iterable[str]) -> int:
     """
-    Remove occurrences of `name` across all sections.
+    Remove all occurrences of every name in `names` across all sections, with one save.
     Returns number of removals.
     """
-    struct = load_domains()
+    names_set = frozenset(names)
+    struct, by_name = _load_indexed()
+    paths = [p for name in names_set for p in by_name.get(name, ())]
+    if not paths:
+        return 0
     data = struct["domains"]
     removed = 0
 
-    # management
-    m = data.get("management", [])
-    new_m = [d for d in m if d.get("name") != name]
-    removed += len(m) - len(new_m)
-    data["management"] = new_m
-
-    # subscription
-    s = data.get("subscription", [])
-    new_s = [d for d in s if d.get("name") != name]
-    removed += len(s) - len(new_s)
-    data["subscription"] = new_s
-
-    # countries
-    countries = data.get("countries", {})
-    for code, lst in list(countries.items()):
-        new_lst = [d for d in lst if d.get("name") != name]
+    # only the containers that hold one of the names are rebuilt, each in one pass
+    for place, code in dict.fromkeys((place, code) for place, code, _ in paths):
+        lst = _container(struct, place, code)
+        new_lst = [d for d in lst if d.get("name") not in names_set]
         removed += len(lst) - len(new_lst)
-        if new_lst:
-            countries[code] = new_lst
+        if place != "countries":
+            data[place] = new_lst
+        elif new_lst:
+            data["countries"][code] = new_lst
         else:
             # keep empty list or remove key? remove key for cleanliness
-            countries.pop(code, None)
-    data["countries"] = countries
+            data["countries"].pop(code, None)
 
     if removed > 0:
         save_domains(struct)
     return removed
 
 
+def remove_domain(name: str) -> int:
+    """
+    Remove occurrences of `name` across all sections.
+    Returns number of removals.
+    """
+    return remove_domains((name,))
+
+
 def update_domain(name: str, **fields) -> Optional[Dict[str, Any]]:
     """
     Update first found domain (search order: management, subscription, countries).
     fields allowed: label, purpose, check_interval_minutes, notify_admins, notes
+    (other keys are ignored)
     """
-    struct = load_domains()
-    data = struct["domains"]
-
-    def _update_in_list(lst):
-        for i, d in enumerate(lst):
-            if d.get("name") == name:
-                for k, v in fields.items():
-                    if k in d:
-                        d[k] = v
-                lst[i] = d
-                return d
+    changes = {k: fields[k] for k in fields.keys() & _ALLOWED_UPDATE_FIELDS}
+    if not changes:
+        # nothing to write
+        entry = find_domain(name)
+        return copy.deepcopy(dict(entry)) if entry is not None else None
+
+    struct, by_name = _load_indexed()
+    paths = by_name.get(name)
+    if not paths:
         return None
 
-    for place in ("management", "subscription"):
-        res = _update_in_list(data.get(place, []))
-        if res:
-            save_domains(struct)
-            return res
+    place, code, i = paths[0]
+    d = _container(struct, place, code)[i]
+    d.update(changes)
 
-    # countries
-    for code, lst in data.get("countries", {}).items():
-        res = _update_in_list(lst)
-        if res:
-            save_domains(struct)
-            return res
+    save_domains(struct)
+    return d
 
-    return None
 
+def touch_last_check(name: str, status: str, details: Optional[Dict[str, Any]] = None,
+                     only_on_change: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Update last_checked_at/status/details for all occurrences of name and save.
 
-def touch_last_check(name: str, status: str, details: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
-    """Update last_checked_at/status/details for all occurrences of name and save."""
-    struct = load_domains()
-    data = struct["domains"]
-    updated = None
+    With only_on_change (default), a check whose status/details did not change only
+    bumps last_checked_at in memory; it is written by the next real change, by
+    flush_domains(), or once it is older than TOUCH_FLUSH_SECONDS.
+    """
     now = _now_iso()
 
-    def _touch(lst):
-        nonlocal updated
-        for i, d in enumerate(lst):
-            if d.get("name") == name:
-                d["last_checked_at"] = now
-                d["last_status"] = status
-                if details is not None:
-                    d["last_details"] = details
-                lst[i] = d
-                updated = d
-
-    _touch(data.get("management", []))
-    _touch(data.get("subscription", []))
-    for lst in data.get("countries", {}).values():
-        _touch(lst)
-
-    if updated is not None:
-        save_domains(struct)
+    if only_on_change and _active_tx() is None:
+        data, by_name = _read_snapshot()
+        paths = by_name.get(name)
+        if not paths:
+            return None
+        changed, stale, updated = True, False, None
+        with _cache_lock:
+            # only touch the snapshot if it is still the cached one
+            if _CACHE["data"] is data:
+                entries = [_container(data, place, code)[i] for place, code, i in paths]
+                changed = any(
+                    d.get("last_status") != status or (details is not None and d.get("last_details") != details)
+                    for d in entries
+                )
+                if not changed:
+                    for d in entries:
+                        d["last_checked_at"] = now
+                    _CACHE["raw"] = None  # no longer matches "data"
+                    if _CACHE["dirty_since"] is None:
+                        _CACHE["dirty_since"] = time.monotonic()
+                    stale = time.monotonic() - _CACHE["dirty_since"] >= TOUCH_FLUSH_SECONDS
+                    updated = copy.deepcopy(entries[-1])
+        if not changed:
+            if stale:
+                flush_domains()
+            return updated
+
+    struct, by_name = _load_indexed()
+    paths = by_name.get(name)
+    if not paths:
+        return None
+
+    updated = None
+    for place, code, i in paths:
+        d = _container(struct, place, code)[i]
+        d["last_checked_at"] = now
+        d["last_status"] = status
+        if details is not None:
+            d["last_details"] = details
+        updated = d
+
+    # high-frequency checker writes: skip the directory fsync (a lost result is re-checked)
+    save_domains(struct, durable=False)
     return updated
+
+
+def flush_domains():
+    """
+    Write last_checked_at updates that touch_last_check kept in memory (no-op if none).
+    Skipped if domains.json was changed by another process meanwhile (disk wins).
+    """
+    with _cache_lock:
+        if _CACHE["dirty_since"] is None:
+            return
+    try:
+        with _acquire_file_lock():
+            with _cache_lock:
+                if _CACHE["dirty_since"] is None:
+                    return
+                if (_CACHE["mtime"], _CACHE["size"]) != _file_key():
+                    _CACHE["dirty_since"] = None
+                    return
+                raw = _CACHE["raw"] if _CACHE["raw"] is not None else _dumps(_CACHE["data"])
+            _write_raw(raw, durable=False)
+    except Timeout:
+        raise RuntimeError("Could not acquire file lock to write domains.json")
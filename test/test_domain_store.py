@@ -0,0 +1,157 @@
+import asyncio
+import json
+
+import pytest
+from filelock import FileLock
+
+from service.domain_service import domain_store as store
+
+
+@pytest.fixture
+def domains_file(tmp_path, monkeypatch):
+    """Point the store at a fresh domains.json in tmp_path with an empty cache."""
+    path = tmp_path / "domains.json"
+    lock = tmp_path / "domains.json.lock"
+    monkeypatch.setattr(store, "DOMAINS_FILE", path)
+    monkeypatch.setattr(store, "LOCK_FILE", lock)
+    monkeypatch.setattr(store, "_file_lock", FileLock(str(lock)))
+    monkeypatch.setattr(store, "_CACHE", {
+        "mtime": None, "size": None, "data": None, "raw": None, "by_name": {}, "dirty_since": None,
+        "flat": [], "flat_by_name": {},
+    })
+    return path
+
+
+def _on_disk(path):
+    return json.loads(path.read_bytes())
+
+
+def _entry_on_disk(path, name):
+    dom = _on_disk(path)["domains"]
+    lists = [dom["management"], dom["subscription"], *dom["countries"].values()]
+    return next(d for lst in lists for d in lst if d["name"] == name)
+
+
+def test_unchanged_status_is_kept_in_memory_until_flush(domains_file, monkeypatch):
+    ticks = iter(f"2026-01-01T00:00:{i:02d}+00:00" for i in range(60))
+    monkeypatch.setattr(store, "_now_iso", lambda: next(ticks))
+    store.add_domain("management", "a.example")
+    store.touch_last_check("a.example", "ok")
+    first = _entry_on_disk(domains_file, "a.example")["last_checked_at"]
+    before = domains_file.read_bytes()
+
+    # same status: only last_checked_at moves, in memory
+    updated = store.touch_last_check("a.example", "ok")
+    assert updated["last_checked_at"] != first
+    assert domains_file.read_bytes() == before
+    assert store.find_domain("a.example")["last_checked_at"] == updated["last_checked_at"]
+
+    store.flush_domains()
+    assert _entry_on_disk(domains_file, "a.example")["last_checked_at"] == updated["last_checked_at"]
+
+
+def test_flush_is_dropped_when_file_changed_on_disk(domains_file):
+    store.add_domain("management", "a.example")
+    store.touch_last_check("a.example", "ok")
+    store.touch_last_check("a.example", "ok")  # pending in-memory bump
+
+    # another process rewrites the file (different size, so the cache key changes)
+    external = {"domains": {"management": [], "subscription": [{"name": "b.example"}], "countries": {}}}
+    domains_file.write_text(json.dumps(external))
+
+    store.flush_domains()
+    assert _on_disk(domains_file) == external
+    assert store.find_domain("a.example") is None
+    assert store.find_domain("b.example") == {"name": "b.example"}
+
+
+def test_transaction_rolls_back_when_block_raises(domains_file):
+    store.add_domain("management", "a.example")
+    before = domains_file.read_bytes()
+
+    with pytest.raises(RuntimeError, match="boom"):
+        with store.domain_transaction():
+            store.add_domain("subscription", "b.example")
+            store.update_domain("a.example", label="changed")
+            assert store.find_domain("b.example") is not None
+            raise RuntimeError("boom")
+
+    assert domains_file.read_bytes() == before
+    assert store.find_domain("b.example") is None
+    assert store.find_domain("a.example")["label"] == "a.example"
+
+
+def test_transaction_writes_once_on_success(domains_file):
+    store.load_domains()  # creates the empty file
+    before = domains_file.read_bytes()
+
+    with store.domain_transaction():
+        store.add_domain("management", "a.example")
+        store.add_domain("countries", "b.example", country="nl")
+        assert domains_file.read_bytes() == before  # nothing written until commit
+
+    assert [d["name"] for d in store.list_all_domains()] == ["a.example", "b.example"]
+    assert [d["name"] for d in store.list_by_country("NL")] == ["b.example"]
+
+
+@pytest.mark.asyncio
+async def test_transaction_is_not_shared_with_other_tasks(domains_file):
+    store.add_domain("management", "a.example")
+    before = domains_file.read_bytes()
+    opened = asyncio.Event()
+    b_done = asyncio.Event()
+
+    async def task_a():
+        with store.domain_transaction():
+            store.update_domain("a.example", label="changed")
+            opened.set()
+            await b_done.wait()
+            raise RuntimeError("boom")
+
+    async def task_b():
+        await opened.wait()
+        try:
+            # not part of A's transaction: refused instead of silently joining it
+            with pytest.raises(RuntimeError, match="another task"):
+                store.add_domain("management", "b.example")
+            assert store.find_domain("a.example")["label"] == "a.example"
+        finally:
+            b_done.set()
+
+    results = await asyncio.gather(task_a(), task_b(), return_exceptions=True)
+    assert isinstance(results[0], RuntimeError) and str(results[0]) == "boom"
+    assert results[1] is None
+
+    assert domains_file.read_bytes() == before
+    # once A is done, B's write goes through
+    store.add_domain("management", "b.example")
+    assert [d["name"] for d in store.list_all_domains()] == ["a.example", "b.example"]
+
+
+def test_remove_domains_counts_every_occurrence(domains_file):
+    store.add_domain("management", "a.example")
+    store.add_domain("subscription", "a.example")
+    store.add_domain("countries", "a.example", country="NL")
+    store.add_domain("countries", "b.example", country="US")
+    store.add_domain("management", "c.example")
+
+    assert store.remove_domains(["a.example", "b.example", "missing.example"]) == 4
+    assert store.remove_domains(["a.example"]) == 0
+    assert store.remove_domain("c.example") == 1
+
+    assert store.list_all_domains() == ()
+    # emptied country lists are dropped
+    assert _on_disk(domains_file)["domains"]["countries"] == {}
+
+
+def test_read_helpers_cannot_change_the_cache(domains_file):
+    store.add_domain("countries", "a.example", country="NL")
+
+    with pytest.raises(TypeError):
+        store.find_domain("a.example")["label"] = "changed"
+    with pytest.raises(TypeError):
+        store.list_all_domains()[0]["label"] = "changed"
+    with pytest.raises(TypeError):
+        store.list_by_country("nl")[0]["label"] = "changed"
+
+    assert store.load_domains()["domains"]["countries"]["NL"][0]["label"] == "a.example"
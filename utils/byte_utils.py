@@ -5,18 +5,30 @@ Production-grade utilities for converting data sizes between bytes and gigabytes
 
 Features:
 - Accurate binary conversion (1 GiB = 1024³ bytes)
+- Integer fast paths (bit shifts) for whole-GiB values
 - Accepts both int and float inputs
 - Returns:
     - int for gb_to_bytes (backend-safe)
     - float for bytes_to_gb (user display, 1 decimal precision)
 - Strict validation and safe error handling
+- Batch helpers (gb_to_bytes_many / bytes_to_gb_many), vectorized with NumPy when installed
 """
 
-from typing import Union
+from typing import Iterable, List, Union
+
+# NumPy turns batch conversions into one typed C loop (optional)
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 # ---------- Constants ----------
 BYTES_IN_GB: float = float(1024 ** 3)  # 1 GiB = 1,073,741,824 bytes
+GB_PER_BYTE: float = 1.0 / BYTES_IN_GB  # reciprocal: multiply instead of divide on hot paths
+_SHIFT_BITS: int = 30  # 1 GiB = 2**30 bytes (exact integer fast paths)
+_GB_MASK: int = (1 << _SHIFT_BITS) - 1
+_NP_MAX_GB: float = float(1 << (63 - _SHIFT_BITS))  # 2**63 bytes: int64 casts are exact below this
 
 
 # ---------- Conversions ----------
@@ -36,12 +48,16 @@ def gb_to_bytes(gb_value: Union[int, float, None]) -> int:
     if gb_value is None:
         return 0
 
+    # Whole GB (the usual case): exact integer shift, no float round-trip
+    if isinstance(gb_value, int) and gb_value >= 0:
+        return gb_value << _SHIFT_BITS
+
     try:
         value = float(gb_value)
         if value < 0:
             raise ValueError("Negative values are not allowed for data sizes.")
         return int(value * BYTES_IN_GB)
-    except (TypeError, ValueError) as e:
+    except (TypeError, ValueError, OverflowError) as e:
         raise ValueError(f"Invalid value for gb_to_bytes: {gb_value!r}") from e
 
 
@@ -61,6 +77,10 @@ def bytes_to_gb(byte_value: Union[int, float, None]) -> float:
     if byte_value is None:
         return 0.0
 
+    # Exact multiple of 1 GiB: shift instead of float division
+    if isinstance(byte_value, int) and byte_value >= 0 and not (byte_value & _GB_MASK):
+        return float(byte_value >> _SHIFT_BITS)
+
     try:
         value = float(byte_value)
         if value < 0:
@@ -68,3 +88,48 @@ def bytes_to_gb(byte_value: Union[int, float, None]) -> float:
         return round(value / BYTES_IN_GB, 1)
     except (TypeError, ValueError) as e:
         raise ValueError(f"Invalid value for bytes_to_gb: {byte_value!r}") from e
+
+
+# ---------- Batch Conversions ----------
+def gb_to_bytes_many(gb_values: Iterable[Union[int, float, None]]) -> List[int]:
+    """
+    Convert many GiB values to bytes at once (e.g. quota reports over all users).
+    None counts as 0, like gb_to_bytes().
+
+    Raises:
+        ValueError: If any value is invalid or negative.
+    """
+    values = [0 if v is None else v for v in gb_values]
+    if np is not None and values:
+        try:
+            arr = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid value for gb_to_bytes_many: {e}") from e
+        if (arr < 0).any():
+            raise ValueError("Negative values are not allowed for data sizes.")
+        # astype(int64) silently wraps NaN/inf/huge values: those batches take the
+        # scalar path, so results never depend on whether NumPy is installed
+        if np.isfinite(arr).all() and (arr < _NP_MAX_GB).all():
+            return (arr * BYTES_IN_GB).astype(np.int64).tolist()
+    return [gb_to_bytes(v) for v in values]
+
+
+def bytes_to_gb_many(byte_values: Iterable[Union[int, float, None]]) -> List[float]:
+    """
+    Convert many byte counts to GiB (rounded to 1 decimal) at once.
+    None counts as 0.0, like bytes_to_gb().
+
+    Raises:
+        ValueError: If any value is invalid or negative.
+    """
+    values = [0 if v is None else v for v in byte_values]
+    if np is not None and values:
+        try:
+            arr = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid value for bytes_to_gb_many: {e}") from e
+        if (arr < 0).any():
+            raise ValueError("Negative values are not allowed for data sizes.")
+        # np.round differs from round() on some halfway cases; round in Python to match bytes_to_gb()
+        return [round(x, 1) for x in (arr * GB_PER_BYTE).tolist()]
+    return [bytes_to_gb(v) for v in values]
@@ -1,12 +1,25 @@
 # utils/config.py
-from dotenv import load_dotenv
-from pydantic import BaseSettings
+from functools import cache, cached_property
+from typing import FrozenSet
 
-# Load environment variables from .env
-load_dotenv()
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# pydantic-settings reads .env itself (env_file below); real environment variables win
 
-class Settings(BaseSettings):
+
+class DatabaseSettings(BaseSettings):
+    # Database Configuration
+    DB_HOST: str
+    DB_PORT: int
+    DB_NAME: str
+    DB_USER: str
+    DB_PASSWORD: str
+
+    # extra="ignore": unrelated keys in .env are skipped (pydantic v1 behaviour)
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
+
+
+class Settings(DatabaseSettings):
     # Telegram
     BOT_TOKEN: str
     ADMINS: str
@@ -24,16 +37,26 @@ class Settings(BaseSettings):
     MARZBAN_USER_FREE: str
     MARZBAN_PASS_FREE: str
 
-    # Database Configuration
-    DB_HOST: str
-    DB_PORT: int
-    DB_NAME: str
-    DB_USER: str
-    DB_PASSWORD: str
+    @cached_property
+    def admin_ids(self) -> FrozenSet[int]:
+        """Telegram IDs from the comma-separated ADMINS, parsed once (O(1) membership checks)."""
+        return frozenset(int(x) for x in self.ADMINS.split(",") if x.strip())
+
+
+@cache
+def get_settings() -> Settings:
+    """Parse .env / environment once and return the shared Settings instance."""
+    return Settings()
+
 
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+@cache
+def get_db_settings() -> DatabaseSettings:
+    """DB fields only, so database tooling does not need the bot/Marzban secrets."""
+    return DatabaseSettings()
 
 
-settings = Settings()
+def __getattr__(name: str):
+    # `settings` is built on first access, not at import (importing this module is free)
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -6,28 +6,44 @@ Utility for generating QR codes from Marzban subscription URLs.
 Features:
 - Generates QR code in-memory (no file saving)
 - Returns PNG bytes ready for Telegram send_photo or HTTP response
+- Encodes off the event loop (asyncio.to_thread), fast PNG compression
+- LRU cache of PNG bytes per URL (same subscription link -> same image)
+- Uses segno when installed, qrcode + Pillow otherwise
 - Lightweight and production-ready
 """
 
+import asyncio
+import hashlib
 import qrcode
+from collections import OrderedDict
 from io import BytesIO
+from PIL import Image
 
+# segno builds the matrix and writes PNG much faster than qrcode + PIL (optional)
+try:
+    import segno
+except ImportError:
+    segno = None
 
-async def generate_qr_code(url: str) -> bytes:
-    """
-    Generate a QR code image (PNG bytes) from a given URL.
+# Render with segno when available (set False to compare against the qrcode/PIL path)
+_USE_SEGNO = segno is not None
 
-    Args:
-        url (str): Subscription link or any string to encode.
+# Max number of cached QR images (a few KB each)
+_QR_CACHE_SIZE = 1024
 
-    Returns:
-        bytes: QR code image as PNG bytes (no file saved).
+# blake2b(url) -> PNG bytes, least recently used first (QR output depends only on the URL)
+_qr_cache: "OrderedDict[bytes, bytes]" = OrderedDict()
 
-    Raises:
-        ValueError: If the URL is missing or invalid.
+
+def _generate_qr_code_sync(url: str) -> bytes:
     """
-    if not url or not isinstance(url, str):
-        raise ValueError("Invalid URL provided for QR code generation")
+    Build the QR code and encode it as PNG (CPU-bound; runs in a worker thread).
+    """
+    if _USE_SEGNO:
+        buffer = BytesIO()
+        # make_qr: never a Micro QR (phones' scanners expect a regular code)
+        segno.make_qr(url, error="m").save(buffer, kind="png", scale=10, border=2)
+        return buffer.getvalue()
 
     # Configure QR generation
     qr = qrcode.QRCode(
@@ -39,15 +55,57 @@ async def generate_qr_code(url: str) -> bytes:
     qr.add_data(url)
     qr.make(fit=True)
 
-    # Create image and store it in memory
-    img = qr.make_image(fill_color="black", back_color="white")
+    # Build the image straight from the module matrix (border included), one byte per
+    # module, then scale up by box_size: skips qrcode's own per-box drawing image
+    matrix = qr.get_matrix()
+    size = len(matrix)
+    pixels = bytes(0 if dark else 255 for row in matrix for dark in row)
+    img = (
+        Image.frombytes("L", (size, size), pixels)
+        .resize((size * qr.box_size, size * qr.box_size), Image.Resampling.NEAREST)
+        .convert("1", dither=Image.Dither.NONE)
+    )
+
+    # Store it in memory
+    # (zlib level 1: several times faster than the default 6, near-identical size for QR images)
     buffer = BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
+    img.save(buffer, format="PNG", optimize=False, compress_level=1)
 
     return buffer.getvalue()  # ✅ return bytes directly, not a file
 
 
+async def generate_qr_code(url: str) -> bytes:
+    """
+    Generate a QR code image (PNG bytes) from a given URL.
+    Rendering and PNG encoding run in a worker thread, so the event loop stays free;
+    results are cached per URL (LRU), so repeat requests skip both.
+
+    Args:
+        url (str): Subscription link or any string to encode.
+
+    Returns:
+        bytes: QR code image as PNG bytes (no file saved).
+
+    Raises:
+        ValueError: If the URL is missing or invalid.
+    """
+    if not url or not isinstance(url, str):
+        raise ValueError("Invalid URL provided for QR code generation")
+
+    # Content-addressed cache: fixed-size key even for very long URLs
+    key = hashlib.blake2b(url.encode(), digest_size=16).digest()
+    png = _qr_cache.get(key)
+    if png is not None:
+        _qr_cache.move_to_end(key)
+        return png
+
+    png = await asyncio.to_thread(_generate_qr_code_sync, url)
+    _qr_cache[key] = png
+    if len(_qr_cache) > _QR_CACHE_SIZE:
+        _qr_cache.popitem(last=False)
+    return png
+
+
 # ---------- Example ----------
 # import asyncio
 #
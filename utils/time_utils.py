@@ -4,14 +4,40 @@ utils/time_utils.py
 Utility for calculating VPN expiration dates based on a number of days
 (typically read from the database for each plan).
 
-Returns ISO8601 datetime string with Iran timezone (+03:30),
+Expiration is kept as epoch seconds (int) and only formatted as an
+ISO8601 datetime string with Iran timezone (+03:30) when sent to Marzban,
 rounded to 00:00 of the next day after the added duration.
+Results are memoized per (date, days), since plans use a handful of lengths.
 """
 
-from datetime import datetime, time, timedelta
-from dateutil.relativedelta import relativedelta
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 
+# Iran timezone and 00:00, built once at import
+_IRAN_TZ = ZoneInfo("Asia/Tehran")
+_MIDNIGHT = time(0, 0)
+
+
+def make_expire_timestamp(days: int) -> int:
+    """
+    Generate an expiration timestamp for a VPN user.
+
+    Args:
+        days (int): Number of days to add to the current time.
+                    (Fetched from the database for the selected plan.)
+
+    Returns:
+        int: Epoch seconds of 00:00 (Iran time) on the day after expiry.
+    """
+    if not isinstance(days, int) or days <= 0:
+        raise ValueError("days must be a positive integer")
+
+    today_iran = datetime.now(tz=_IRAN_TZ).date()
+
+    # Result only depends on today's date, so it is cached per (day, plan length)
+    return _expire_timestamp_for(today_iran, days)
+
 
 def make_expire_date(days: int) -> str:
     """
@@ -25,17 +51,25 @@ def make_expire_date(days: int) -> str:
         str: ISO 8601 formatted datetime string with Iran timezone.
              Example: "2025-01-15T00:00:00+03:30"
     """
-    if not isinstance(days, int) or days <= 0:
-        raise ValueError("days must be a positive integer")
+    return format_expire(make_expire_timestamp(days))
 
-    iran_tz = ZoneInfo("Asia/Tehran")
-    now_iran = datetime.now(tz=iran_tz)
 
-    # Add duration to current time
-    expire_time = now_iran + relativedelta(days=days)
+@lru_cache(maxsize=16)
+def format_expire(timestamp: int) -> str:
+    """
+    Format an expiration timestamp as the ISO 8601 string Marzban expects (Iran timezone).
+    """
+    return datetime.fromtimestamp(timestamp, tz=_IRAN_TZ).isoformat()
+
 
-    # Move to start of *next* day at 00:00
-    next_day = (expire_time + timedelta(days=1)).date()
-    expire_at_midnight = datetime.combine(next_day, time(0, 0), tzinfo=iran_tz)
+@lru_cache(maxsize=16)
+def _expire_timestamp_for(today: date, days: int) -> int:
+    """
+    Build the expiration timestamp for a plan of `days` days starting on `today` (Iran date).
+    """
+    # Move to start of the day *after* the added duration, at 00:00
+    # (plain day arithmetic: timedelta, relativedelta is only needed for months/years)
+    next_day = today + timedelta(days=days + 1)
+    expire_at_midnight = datetime.combine(next_day, _MIDNIGHT, tzinfo=_IRAN_TZ)
 
-    return expire_at_midnight.replace(microsecond=0).isoformat()
+    return int(expire_at_midnight.timestamp())